@@ -1,15 +1,22 @@
+import argparse
 import csv
+import importlib.util
+import io
+import json
+import logging
 import numpy as np
 import os
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import chain
 
+import binaryLog
+import logReader
+from parallelResample import PROGRESS_ROWS, run_windows, window_count
+from sampleFilter import SampleFilter, finish_filter
 
-sample_intervals = None
-casing_height = None
-declination = None
-tool_name = None
-hole_id = None
-project_code = None
+logger = logging.getLogger("TeleviewerToGyro")
 
 
 class Gyro:
@@ -20,10 +27,195 @@ class Gyro:
 
     def print_gyro(self):
         print(f"Depth: {self.depth}, Tilt: {self.tilt}, Azimuth: {self.azimuth}")
+
+
+class BinnedGyro(Gyro):
+    # One output station summarising every sample in its interval bin
+    def __init__(self, depth, tilt, azimuth, tilt_std, azimuth_std, count):
+        super().__init__(depth, tilt, azimuth)
+        self.tilt_std = tilt_std
+        self.azimuth_std = azimuth_std
+        self.count = count
+
+
+class Survey:
+    # One hole as contiguous float64 columns, with the source column names attached.
+    # Slices and depth_range() are views onto the same arrays. Gyro records are only built
+    # when iterating or indexing a single station, for code written against lists of Gyro.
+    # decimals holds the depth and tilt decimals of the source file when those columns are
+    # source values, so they are written back as they were read; None where computed.
+    def __init__(self, depths, tilts, azimuths, columns=("DEPTH", "TILT", "AZIMUTH"), hole_id=None,
+                 tilt_stds=None, azimuth_stds=None, counts=None, decimals=(None, None)):
+        # Resampled depth grids are whole metres and stay integer, so they write as "15" not "15.0"
+        self.depths = np.asarray(depths)
+        if self.depths.dtype.kind not in "iu":
+            self.depths = self.depths.astype(np.float64, copy=False)
+        self.tilts = np.asarray(tilts, dtype=np.float64)
+        self.azimuths = np.asarray(azimuths, dtype=np.float64)
+        self.columns = list(columns)
+        self.hole_id = hole_id
+        self.decimals = tuple(decimals)
+        self.tilt_stds = self.azimuth_stds = self.counts = None
+        if counts is not None:
+            self.tilt_stds = np.asarray(tilt_stds, dtype=np.float64)
+            self.azimuth_stds = np.asarray(azimuth_stds, dtype=np.float64)
+            self.counts = np.asarray(counts, dtype=np.int64)
+
+    @classmethod
+    def from_gyros(cls, gyros, columns=("DEPTH", "TILT", "AZIMUTH"), hole_id=None):
+        survey = cls([float(g.depth) for g in gyros], [float(g.tilt) for g in gyros],
+                     [float(g.azimuth) for g in gyros], columns, hole_id)
+        if gyros and isinstance(gyros[0], BinnedGyro):
+            survey.tilt_stds = np.array([g.tilt_std for g in gyros], dtype=np.float64)
+            survey.azimuth_stds = np.array([g.azimuth_std for g in gyros], dtype=np.float64)
+            survey.counts = np.array([g.count for g in gyros], dtype=np.int64)
+        return survey
+
+    @property
+    def binned(self):
+        return self.counts is not None
+
+    @property
+    def headers(self):
+        return Gyro(*self.columns)
+
+    def values(self):
+        # Columns in output order: depth, tilt, azimuth, then the bin statistics if any
+        if self.binned:
+            return [self.depths, self.tilts, self.azimuths, self.tilt_stds, self.azimuth_stds, self.counts]
+        return [self.depths, self.tilts, self.azimuths]
+
+    def __len__(self):
+        return len(self.depths)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.record(index)
+        # Slices give views; index arrays and masks give copies, as with numpy
+        return Survey(*(column[index] for column in self.values()[:3]), self.columns, self.hole_id,
+                      *(column[index] for column in self.values()[3:]), decimals=self.decimals)
+
+    def __iter__(self):
+        values = [column.tolist() for column in self.values()]
+        record = BinnedGyro if self.binned else Gyro
+        for row in zip(*values):
+            yield record(*row)
+
+    def record(self, index):
+        row = [column[index].item() for column in self.values()]
+        return BinnedGyro(*row) if self.binned else Gyro(*row)
+
+    def depth_range(self, top, bottom):
+        # Stations with top <= depth <= bottom; depths must be sorted, as resampled surveys are
+        start = np.searchsorted(self.depths, top, side="left")
+        stop = np.searchsorted(self.depths, bottom, side="right")
+        return self[start:stop]
+
+    def print_gyro(self):
+        for record in self:
+            record.print_gyro()
+
+
+NULL_VALUES = logReader.NULL_VALUES
+
+
+class ConversionConfig:
+    # Everything one conversion needs, so several can run side by side without sharing globals
+    def __init__(self, hole_id="hole", tool_name="GYRO", project_code=None, declination=19.1,
+                 casing_height=15.0, sample_intervals=5, method="nearest", dedupe="first", dedupe_tolerance=0.0,
+                 output_format="csv", precision=None, null_values=NULL_VALUES, tilt_range=(-1000.0, 1000.0),
+                 azimuth_range=(-1000.0, 1000.0), spike_window=0, spike_threshold=3.5, spike_floor=0.5,
+                 report_rejected=False, resample_workers=1):
+        self.hole_id = hole_id
+        self.tool_name = tool_name
+        self.project_code = project_code
+        self.declination = declination
+        self.casing_height = casing_height
+        self.sample_intervals = sample_intervals
+        self.method = method
+        self.dedupe = dedupe
+        self.dedupe_tolerance = dedupe_tolerance
+        # csv, npz, parquet or feather. precision=None writes values as read/computed, as
+        # before; an int fixes the number of decimals for tilt, azimuth and bin statistics.
+        self.output_format = output_format
+        self.precision = precision
+        # Sample filtering, see SampleFilter. spike_window=0 turns the spike test off.
+        self.null_values = null_values
+        self.tilt_range = tilt_range
+        self.azimuth_range = azimuth_range
+        self.spike_window = spike_window
+        self.spike_threshold = spike_threshold
+        self.spike_floor = spike_floor
+        self.report_rejected = report_rejected
+        # Processes for resampling long logs in depth windows; the output is the same as with 1
+        self.resample_workers = resample_workers
+
+    def label(self):
+        return f"{self.project_code}_{self.hole_id}" if self.project_code is not None else self.hole_id
+
+
+class ConversionCancelled(Exception):
+    pass
+
+
+class ConversionMetrics:
+    # Wall time and row counts per pipeline stage; a stage entered more than once (one per
+    # chunk, say) accumulates. Long loops also call progress(), which forwards to an optional
+    # callback(stage, done, total) and raises ConversionCancelled once cancel_event is set.
+    def __init__(self, progress_callback=None, cancel_event=None):
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event
+
+    def progress(self, stage, done, total):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ConversionCancelled(f"Cancelled during {stage}")
+        if self.progress_callback is not None:
+            self.progress_callback(stage, done, total)
+
+    @contextmanager
+    def stage(self, name):
+        stage = self.stages.setdefault(name, {"seconds": 0.0, "rows": 0})
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage["seconds"] += time.perf_counter() - start
+
+    def report(self, **extra):
+        stages = {}
+        for name, stage in self.stages.items():
+            rows_per_second = stage["rows"] / stage["seconds"] if stage["seconds"] > 0 else None
+            stages[name] = {"seconds": stage["seconds"], "rows": stage["rows"], "rows_per_second": rows_per_second}
+        return dict(extra, total_seconds=time.perf_counter() - self.started, stages=stages)
+
+    def log_summary(self, level=logging.INFO):
+        report = self.report()
+        for name, stage in report["stages"].items():
+            rate = f", {stage['rows_per_second']:,.0f} rows/s" if stage["rows_per_second"] else ""
+            logger.log(level, f"{name:>9}: {stage['seconds']:8.3f} s, {stage['rows']} rows{rate}")
+        logger.log(level, f"{'total':>9}: {report['total_seconds']:8.3f} s")
+
+    def dump_json(self, path, **extra):
+        with open(path, 'w') as outfile:
+            json.dump(self.report(**extra), outfile, indent=2)
 ############################################################################################################
 
 def main():
-    global declination, sample_intervals, casing_height, tool_name, hole_id
+    parser = argparse.ArgumentParser(description="Convert a televiewer export to a gyro survey CSV")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log debug detail")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only log warnings and errors")
+    parser.add_argument("--metrics", default=None, help="write per-stage timings to this JSON file")
+    parser.add_argument("--watch", type=float, default=None, metavar="SECONDS",
+                        help="keep converting a log that is still being acquired, polling this often; Ctrl+C stops")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes for resampling logs long enough to gain from them; 0 uses every core")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING if args.quiet else logging.INFO,
+                        format="%(message)s")
+
+    config = ConversionConfig(resample_workers=args.workers)
 
     print("Welcome to CSV Converter!")
     input_file = input("Please enter the input file path: ").strip()
@@ -33,7 +225,7 @@ def main():
         if not declination_input:
             break
         try:
-            declination = float(declination_input)
+            config.declination = float(declination_input)
             break
         except ValueError:
             print("Please enter a valid declination value.")
@@ -43,7 +235,7 @@ def main():
         if not sample_intervals_input:
             break
         try:
-            sample_intervals = int(sample_intervals_input)
+            config.sample_intervals = int(sample_intervals_input)
             break
         except ValueError:
             print("Please enter a valid sample interval value.")
@@ -53,54 +245,103 @@ def main():
         if not casing_height_input:
             break
         try:
-            casing_height = float(casing_height_input)
+            config.casing_height = float(casing_height_input)
             break
         except ValueError:
             print("Please enter a valid casing height value.")
 
     while True:
-        tool_name = input("Please enter the tool name (default is 'gyro'): ").strip().upper()
-        if tool_name:
+        config.tool_name = input("Please enter the tool name (default is 'gyro'): ").strip().upper()
+        if config.tool_name:
             break
         else:
             print("Tool name cannot be empty. Please enter a valid tool name.")
 
     while True:
-        hole_id = input("Please enter the hole ID (default is 'hole'): ").strip()
-        if hole_id:
+        config.hole_id = input("Please enter the hole ID (default is 'hole'): ").strip()
+        if config.hole_id:
             break
         else:
             print("Hole ID cannot be empty. Please enter a valid hole ID.")
 
-    ask_project_code()
+    config.project_code = ask_project_code()
+
+    if args.watch:
+        from incremental import watch_file
+        output = watch_file(input_file, config, args.watch)
+        print(f"Watch stopped. Output saved to: {output}")
+        return
 
-    output = create_output_file(input_file)
+    metrics = ConversionMetrics()
+    output = create_output_file(input_file, config, metrics=metrics)
+    metrics.log_summary()
+    if args.metrics:
+        metrics.dump_json(args.metrics, input_file=input_file, output_file=output)
 
     print(f"Conversion complete. Output saved to: {output}")
 
 ############################################################################################################
 def ask_project_code():
-    global project_code
     ask = input("Do you want to enter a project code? (y/n): ").strip()
     if ask.lower() == 'y':
-        project_code = input("Please enter the project code: ").strip().upper()
+        return input("Please enter the project code: ").strip().upper()
     else:
-        project_code = None
+        return None
 
 ############################################################################################################
 
-def create_output_file(input_file):
-    global hole_id, tool_name, project_code
-    file_counter = 1
+def create_output_file(input_file, config, cache=None, metrics=None):
+    output_file = check_output_file(output_file_name(input_file, config), 1)
+    try:
+        convert_file(input_file, output_file, config, cache, metrics)
+    except ConversionCancelled:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        raise
+    return output_file
+
+
+def convert_file(input_file, output_file, config, cache=None, metrics=None):
+    metrics = metrics or ConversionMetrics()
+
+    # All-data exports skip resampling and go straight from parsed chunks to the writer;
+    # they are too large to be worth caching
+    if input_file.endswith(binaryLog.EXTENSION):
+        stream_binary_log(input_file, output_file, config, metrics=metrics)
+        return
+
+    # A cache hit skips filtering, so there would be no rejected rows to report
+    if cache is None or config.report_rejected or config.sample_intervals == 0:
+        stream_text_file(input_file, output_file, config, metrics=metrics)
+        return
+
+    # Labels (hole ID, tool, project code) are not part of the key, so changing only
+    # those reuses the resampled survey and skips parsing entirely
+    with metrics.stage("cache"):
+        key = cache.key(input_file, config, lambda done, total: metrics.progress("hash", done, total))
+        survey = cache.get(key)
+    if survey is None:
+        log = logReader.open_log(input_file)
+        chunks = logReader.read_chunks(log, CHUNK_SIZE, lambda done, total: metrics.progress("read", done, total))
+        sample_filter = SampleFilter.from_config(config)
+        survey = resample_chunks(chunks, log.header, config, sample_filter, metrics, decimals=log.decimals)
+        sample_filter.log_summary()
+        cache.put(key, survey)
+    else:
+        logger.info(f"Using cached survey for {input_file}")
+    with metrics.stage("write") as stage:
+        create_csv_file(survey, survey.headers, output_file, config, metrics)
+        stage["rows"] += len(survey)
+
 
+def output_file_name(input_file, config, file_counter=1):
     input_file_directory = os.path.dirname(input_file)
+    extension = OUTPUT_EXTENSIONS[config.output_format]
 
-    if project_code:
-        output_file = os.path.join(input_file_directory, f"{project_code}_{hole_id}_Gy_{tool_name}_{file_counter}_{get_date()}.csv")
+    if config.project_code:
+        return os.path.join(input_file_directory, f"{config.project_code}_{config.hole_id}_Gy_{config.tool_name}_{file_counter}_{get_date()}.{extension}")
     else:
-        output_file = os.path.join(input_file_directory, f"{hole_id}_Gy_{tool_name}_{file_counter}_{get_date()}.csv")
-
-    read_text_file(input_file, check_output_file(output_file, file_counter))
+        return os.path.join(input_file_directory, f"{config.hole_id}_Gy_{config.tool_name}_{file_counter}_{get_date()}.{extension}")
 
 ############################################################################################################
 def check_output_file(output_file, file_counter):
@@ -119,110 +360,603 @@ def get_date():
 
 ############################################################################################################
 
-def read_text_file(input_file, output_file):
-    with open(input_file, 'r') as infile:
-        lines = infile.readlines()
-
-    create_data(lines, output_file)
-
-############################################################################################################
-
-def create_data(lines, output_file):
-    global sample_intervals, casing_height
-    gyros = []
-    for line in lines:
-        cleaned_line = ' '.join(line.split())
-        if cleaned_line:
-            columns = cleaned_line.split()
-            gyro = create_obj(columns)
-            gyros.append(gyro)
+def read_text_file(input_file, output_file, config, metrics=None):
+    # The old line-by-line entry point, now the streaming conversion
+    return stream_text_file(input_file, output_file, config, metrics=metrics)
 
-    final_gyros = calculate_interval(gyros, sample_intervals, casing_height)
 
-    create_csv_file(final_gyros, gyros[0], output_file)
+def create_data(lines, output_file, config, metrics=None):
+    # A whitespace text export already read into lines, header first, converted the same way
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        raise ValueError("No header found")
+    header = lines[0].split()
+    usecols = find_columns(header)
+    data = lines[1:]
+    decimals = logReader.column_decimals(data[:logReader.DECIMALS_ROWS], usecols[:2])
+    chunks = (logReader.parse_rows(data[start:start + CHUNK_SIZE], usecols)
+              for start in range(0, len(data), CHUNK_SIZE))
+    return convert_chunks(chunks, header, output_file, config, metrics, decimals=decimals)
 
 ############################################################################################################
 
-depth_index = None
-tilt_index = None
-azimuth_index = None
-def create_obj(columns):
-    global declination, depth_index, tilt_index, azimuth_index
-   
-
-    if depth_index and tilt_index and azimuth_index is None:
-        return Gyro(depth=columns[depth_index], tilt=columns[tilt_index], azimuth=columns[azimuth_index])
-    for i, col in enumerate(columns):
-        if "DEPT" in col.upper():
-            depth_index = i
-        elif "TILT" in col.upper():
-            tilt_index = i
-        elif "AZIMUTH" in col.upper():
-            azimuth_index = i
+def create_obj(columns, column_map):
+    # column_map is the depth, tilt and azimuth indices from find_columns. Short rows become
+    # an empty Gyro, which the sample filter rejects as null.
+    depth_col, tilt_col, azimuth_col = column_map
     try:
-        columns[azimuth_index] = str(float(columns[azimuth_index]) + declination)
-        if float(columns[azimuth_index]) > 360:
-            columns[azimuth_index] = azimuth_correction(columns[azimuth_index])
-        return Gyro(depth=columns[depth_index], tilt=columns[tilt_index], azimuth=columns[azimuth_index])
-    except (ValueError, IndexError):
-        return Gyro(depth=columns[depth_index], tilt=columns[tilt_index], azimuth=columns[azimuth_index])
+        return Gyro(depth=columns[depth_col], tilt=columns[tilt_col], azimuth=columns[azimuth_col])
+    except IndexError:
+        return Gyro(depth=None, tilt=None, azimuth=None)
 
 ############################################################################################################
 
-def azimuth_correction(azimuth):
-    return float(azimuth) - 360 if float(azimuth) > 360 else float(azimuth)
-
-############################################################################################################
+def wrap_azimuths(azimuths):
+    azimuths = np.mod(azimuths, 360)
+    # np.mod of a tiny negative number rounds up to exactly 360
+    return np.where(azimuths >= 360, azimuths - 360, azimuths)
 
-def calculate_interval(gyros, sample_intervals, casing_height):
-    d_gyros = []
-    added_depth = []
-    final_gyros = []
 
-    for gyro in gyros[1:]:
-        if int(float(gyro.depth)) >= casing_height:
-            d_gyros.append(gyro)
+def correct_azimuths(azimuths, declination):
+    # Applied after filtering, so every value left is a bearing to rotate and wrap
+    return wrap_azimuths(np.asarray(azimuths, dtype=np.float64) + declination)
 
-    for gyro in d_gyros:
-        if gyro.depth not in added_depth:
-            added_depth.append(gyro.depth)
-            final_gyros.append(gyro)
 
-    valid_gyros = []
-    for g in d_gyros:
-        if not (-1000 <= float(g.tilt) <= 1000 and -1000 <= float(g.azimuth) <= 1000):
-            continue  
-        valid_gyros.append(g)
+def circular_mean(sin_sums, cos_sums):
+    # Mean bearing of each group of azimuths from the sums of their sines and cosines, so 359
+    # and 1 average to 0 and not 180. Callers sum per group with np.add.reduceat or np.bincount.
+    return wrap_azimuths(np.degrees(np.arctan2(sin_sums, cos_sums)))
 
-    final_gyros = valid_gyros
+############################################################################################################
 
-    interpolated_gyros = []
-    start_depth = int(float(final_gyros[0].depth))
-    end_depth = int(float(final_gyros[-1].depth))
+def nearest_sample_indices(depths, target_depths):
+    # Index of the nearest sample for every target depth. Ties go to the sample that
+    # appears first in the input, same as min() over the list did.
+    depths = np.asarray(depths, dtype=np.float64)
+    target_depths = np.asarray(target_depths, dtype=np.float64)
+
+    order = np.argsort(depths, kind="stable")
+    unique_depths, first_positions = np.unique(depths[order], return_index=True)
+    first_indices = order[first_positions]
+
+    upper = np.clip(np.searchsorted(unique_depths, target_depths, side="left"), 0, len(unique_depths) - 1)
+    lower = np.clip(upper - 1, 0, len(unique_depths) - 1)
+
+    lower_distance = np.abs(unique_depths[lower] - target_depths)
+    upper_distance = np.abs(unique_depths[upper] - target_depths)
+    take_upper = (upper_distance < lower_distance) | (
+        (upper_distance == lower_distance) & (first_indices[upper] < first_indices[lower]))
+
+    return first_indices[np.where(take_upper, upper, lower)]
+
+
+DEDUPE_POLICIES = ("first", "last", "mean")
+RESAMPLING_METHODS = ("nearest", "linear", "bin", "bin_median")
+BIN_STAT_HEADERS = ["TILT_STD", "AZIMUTH_STD", "COUNT"]
+
+
+def dedupe_samples(depths, tilts, azimuths, policy="first", tolerance=0.0):
+    # Groups repeated depths with one stable sort: sorted depths start a new group wherever
+    # they step by more than tolerance (e.g. half the logging step, for overlapping up/down
+    # passes), so with 0 only equal depths are grouped. "first" and "last" keep the group's
+    # first and last sample in file order. Returns the index each group is represented by
+    # plus its depth/tilt/azimuth, in file order of the representatives. "mean" averages
+    # depth and tilt and takes the circular mean of azimuth.
+    if policy not in DEDUPE_POLICIES:
+        raise ValueError(f"Unknown dedupe policy: {policy}")
+    depths = np.asarray(depths, dtype=np.float64)
+    tilts = np.asarray(tilts, dtype=np.float64)
+    azimuths = np.asarray(azimuths, dtype=np.float64)
+    if len(depths) == 0:
+        return np.empty(0, dtype=np.int64), depths, tilts, azimuths
+
+    order = np.argsort(depths, kind="stable")
+    starts = np.flatnonzero(np.concatenate(([True], np.diff(depths[order]) > tolerance)))
+    counts = np.diff(np.append(starts, len(depths)))
+
+    if policy == "last":
+        kept = np.maximum.reduceat(order, starts)
+    else:
+        kept = np.minimum.reduceat(order, starts)
+    file_order = np.argsort(kept, kind="stable")
+    kept = kept[file_order]
+
+    if policy != "mean":
+        return kept, depths[kept], tilts[kept], azimuths[kept]
+
+    mean_depths = np.add.reduceat(depths[order], starts) / counts
+    mean_tilts = np.add.reduceat(tilts[order], starts) / counts
+    radians = np.radians(azimuths[order])
+    mean_azimuths = circular_mean(np.add.reduceat(np.sin(radians), starts), np.add.reduceat(np.cos(radians), starts))
+    return kept, mean_depths[file_order], mean_tilts[file_order], mean_azimuths[file_order]
+
+
+def bin_samples(depths, tilts, azimuths, target_depths, sample_intervals, statistic="mean", first_bin=0,
+                last_bin=None):
+    # Every sample goes to the bin centred on its nearest output depth. Per occupied bin this
+    # returns depth, mean (or median) tilt, circular mean azimuth, tilt standard deviation,
+    # circular standard deviation of azimuth and the sample count. Empty bins are dropped.
+    # first_bin/last_bin limit the result to target_depths[first_bin:last_bin], numbering
+    # bins from the first output depth all the same, so depth windows match the whole log.
+    depths = np.asarray(depths, dtype=np.float64)
+    tilts = np.asarray(tilts, dtype=np.float64)
+    azimuths = np.asarray(azimuths, dtype=np.float64)
+    if last_bin is None:
+        last_bin = len(target_depths)
+    bin_count = last_bin - first_bin
+    if bin_count <= 0:
+        empty = np.empty(0)
+        return target_depths[first_bin:last_bin], empty, empty, empty, empty, np.empty(0, dtype=np.int64)
+
+    bins = np.floor((depths - target_depths[0]) / sample_intervals + 0.5).astype(np.int64) - first_bin
+    inside = (bins >= 0) & (bins < bin_count)
+    bins, tilts, radians = bins[inside], tilts[inside], np.radians(azimuths[inside])
+
+    counts = np.bincount(bins, minlength=bin_count)
+    occupied = counts > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_tilts = np.bincount(bins, tilts, bin_count) / counts
+        tilt_stds = np.sqrt(np.maximum(np.bincount(bins, tilts * tilts, bin_count) / counts - mean_tilts ** 2, 0))
+        sin_sums = np.bincount(bins, np.sin(radians), bin_count)
+        cos_sums = np.bincount(bins, np.cos(radians), bin_count)
+        resultant = np.clip(np.hypot(sin_sums, cos_sums) / counts, 1e-12, 1.0)
+    mean_azimuths = circular_mean(sin_sums, cos_sums)
+    azimuth_stds = np.degrees(np.sqrt(-2 * np.log(resultant)))
+
+    if statistic == "median":
+        sorted_tilts = tilts[np.lexsort((tilts, bins))]
+        starts = np.cumsum(counts) - counts
+        lower = (starts + (counts - 1) // 2)[occupied]
+        upper = (starts + counts // 2)[occupied]
+        mean_tilts[occupied] = (sorted_tilts[lower] + sorted_tilts[upper]) / 2
+
+    target_depths = target_depths[first_bin:last_bin]
+    return (target_depths[occupied], mean_tilts[occupied], mean_azimuths[occupied],
+            tilt_stds[occupied], azimuth_stds[occupied], counts[occupied])
+
+
+def resample_arrays(depths, tilts, azimuths, sample_intervals, method="nearest", start_depth=None, end_depth=None,
+                    workers=1, progress=None):
+    # Returns depth, tilt and azimuth arrays, plus the bin statistics for the bin methods.
+    # The output runs from the shallowest to the deepest sample unless given. progress is
+    # called with (stations done, stations) while long logs are resampled in windows.
+    start_depth = int(np.min(depths) if start_depth is None else start_depth)
+    end_depth = int(np.max(depths) if end_depth is None else end_depth)
+    target_depths = np.arange(start_depth, end_depth, sample_intervals)
+    target_range = (start_depth, end_depth, sample_intervals)
+    if method not in RESAMPLING_METHODS:
+        raise ValueError(f"Unknown resampling method: {method}")
+    workers = window_count(depths, target_depths, workers, method)
+    if workers > 1:
+        return resample_windows(depths, tilts, azimuths, target_range, method, workers, workers, progress)
+    steps = min(len(depths) // PROGRESS_ROWS, len(target_depths))
+    if progress is not None and steps > 1 and not np.any(depths[1:] < depths[:-1]):
+        # The same windows one after another in this process, reporting between them
+        return resample_windows(depths, tilts, azimuths, target_range, method, steps, 1, progress)
+    if method in ("bin", "bin_median"):
+        return bin_samples(depths, tilts, azimuths, target_depths, sample_intervals,
+                           "median" if method == "bin_median" else "mean")
+    if method == "linear":
+        tilt_values, azimuth_values = resample_linear(depths, tilts, azimuths, target_depths)
+        return target_depths, tilt_values, azimuth_values
+    indices = nearest_sample_indices(np.trunc(depths), target_depths)
+    return target_depths, tilts[indices], azimuths[indices]
+
+
+def resample_linear(depths, tilts, azimuths, target_depths):
+    depths = np.asarray(depths, dtype=np.float64)
+    order = np.argsort(depths, kind="stable")
+    sorted_depths, first_positions = np.unique(depths[order], return_index=True)
+    keep = order[first_positions]
+
+    tilt_values = np.interp(target_depths, sorted_depths, np.asarray(tilts, dtype=np.float64)[keep])
+    # Unwrap so that e.g. 359 -> 1 interpolates through 0 and not through 180
+    unwrapped = np.unwrap(np.asarray(azimuths, dtype=np.float64)[keep], period=360)
+    azimuth_values = np.mod(np.interp(target_depths, sorted_depths, unwrapped), 360)
+
+    return tilt_values, azimuth_values
 
-    for depth in np.arange(start_depth, end_depth, sample_intervals):
-        closest_gyro = min(final_gyros, key=lambda g: abs(int(float(g.depth)) - depth))
-    
-        interpolated_gyros.append(Gyro(depth=depth, tilt=closest_gyro.tilt, azimuth=closest_gyro.azimuth))
+############################################################################################################
 
-        interpolated_gyros[-1].print_gyro()
+def resample_windows(depths, tilts, azimuths, target_range, method, windows, workers, progress=None):
+    # resample_arrays for depth-sorted samples, cut into this many windows (see parallelResample)
+    target_depths = np.arange(*target_range)
+    if method == "nearest":
+        indices = np.concatenate([indices for indices, in run_windows(window_result, method, [np.trunc(depths)],
+                                                                      target_range, windows, workers, progress)])
+        return target_depths, tilts[indices], azimuths[indices]
+
+    if method == "linear":
+        # Repeated depths and the azimuth unwrap depend on the whole log, so they are
+        # resolved here as in resample_linear; the windows only interpolate
+        keep = np.flatnonzero(np.concatenate(([True], depths[1:] != depths[:-1])))
+        columns = [depths[keep], np.asarray(tilts, dtype=np.float64)[keep],
+                   np.unwrap(np.asarray(azimuths, dtype=np.float64)[keep], period=360)]
+        tilt_values, azimuth_values = (np.concatenate(column)
+                                       for column in zip(*run_windows(window_result, method, columns, target_range,
+                                                                      windows, workers, progress)))
+        return target_depths, tilt_values, azimuth_values
+
+    results = run_windows(window_result, method, [depths, tilts, azimuths], target_range, windows, workers, progress)
+    return tuple(np.concatenate(column) for column in zip(*results))
+
+
+def window_result(method, columns, target_range, first, last, start):
+    # One window of resample_windows, on the slice of columns starting at sample start
+    target_depths = np.arange(*target_range)
+    if method == "nearest":
+        return (nearest_sample_indices(columns[0], target_depths[first:last]) + start,)
+    if method == "linear":
+        depths, tilts, unwrapped = columns
+        window = target_depths[first:last]
+        return np.interp(window, depths, tilts), np.mod(np.interp(window, depths, unwrapped), 360)
+    return bin_samples(*columns, target_depths, target_range[2], "median" if method == "bin_median" else "mean",
+                       first, last)
 
-    print(f"Total interpolated gyros: {len(interpolated_gyros)}")
+############################################################################################################
 
-    return interpolated_gyros
+CHUNK_SIZE = 100000
+
+
+def find_columns(columns):
+    # Paths that take values as they are need a real tilt column; dip is only converted by logReader
+    column_map = logReader.map_columns(tuple(columns))
+    if column_map.is_dip:
+        raise ValueError(f"Found dip but no TILT column in header: {columns}")
+    return column_map.usecols
+
+
+class StreamingResampler:
+    # Keeps only the first sample seen for each distinct key depth, which is all the nearest
+    # lookup needs. Nearest mode keys on whole metres, so memory grows with hole length and
+    # not with the number of rows. Linear mode keys on the exact depth.
+    # Binning, and any dedupe other than exact keep-first, need every sample, so those
+    # chunks are held as float arrays and resolved in resample().
+    def __init__(self, method="nearest", dedupe="first", dedupe_tolerance=0.0, workers=1):
+        if method not in RESAMPLING_METHODS:
+            raise ValueError(f"Unknown resampling method: {method}")
+        if dedupe not in DEDUPE_POLICIES:
+            raise ValueError(f"Unknown dedupe policy: {dedupe}")
+        self.method = method
+        self.dedupe = dedupe
+        self.dedupe_tolerance = dedupe_tolerance
+        self.workers = workers
+        holds_samples = dedupe != "first" or dedupe_tolerance or method in ("bin", "bin_median")
+        self.held_chunks = [] if holds_samples else None
+        self.keys = np.empty(0)
+        self.first_indices = np.empty(0, dtype=np.int64)
+        self.tilts = np.empty(0)
+        self.azimuths = np.empty(0)
+        self.sample_count = 0
+        self.start_depth = None
+        self.end_depth = None
+
+    def add_chunk(self, depths, tilts, azimuths):
+        if len(depths) == 0:
+            return
+        # Overlapping passes come back up the hole, so the range is the shallowest and deepest
+        # sample seen and not the first and last
+        if self.start_depth is None:
+            self.start_depth, self.end_depth = np.min(depths), np.max(depths)
+        else:
+            self.start_depth = min(self.start_depth, np.min(depths))
+            self.end_depth = max(self.end_depth, np.max(depths))
+
+        if self.held_chunks is not None:
+            self.held_chunks.append((np.array(depths, dtype=np.float64), np.array(tilts, dtype=np.float64),
+                                     np.array(azimuths, dtype=np.float64)))
+            self.sample_count += len(depths)
+            return
+
+        keys = np.trunc(depths) if self.method == "nearest" else depths
+        _, positions = np.unique(keys, return_index=True)
+
+        # Existing entries come first, so np.unique keeps them over later duplicates
+        all_keys = np.concatenate((self.keys, keys[positions]))
+        all_indices = np.concatenate((self.first_indices, self.sample_count + positions))
+        all_tilts = np.concatenate((self.tilts, tilts[positions]))
+        all_azimuths = np.concatenate((self.azimuths, azimuths[positions]))
+        self.keys, keep = np.unique(all_keys, return_index=True)
+        self.first_indices = all_indices[keep]
+        self.tilts = all_tilts[keep]
+        self.azimuths = all_azimuths[keep]
+
+        self.sample_count += len(depths)
+
+    def settle(self, settled_depth, sample_intervals):
+        # Drops held samples that can no longer change any output deeper than settled_depth, so
+        # a log followed while it grows is not held in full. Only the bin methods allow this: a
+        # bin sees samples within half an interval of its depth, while nearest can reach back
+        # over a gap and linear unwraps azimuth along the whole log. The cut is at a dedupe
+        # group boundary at least an interval above settled_depth, so no group is split.
+        if not self.held_chunks or self.method not in ("bin", "bin_median"):
+            return
+        depths, tilts, azimuths = (np.concatenate(column) for column in zip(*self.held_chunks))
+        sorted_depths = np.sort(depths)
+        boundaries = np.concatenate(([0], np.flatnonzero(np.diff(sorted_depths) > self.dedupe_tolerance) + 1,
+                                     [len(sorted_depths)]))
+        below = np.searchsorted(sorted_depths, settled_depth - sample_intervals, side="right")
+        cut = boundaries[np.searchsorted(boundaries, below, side="right") - 1]
+        if cut == 0:
+            return
+        keep = depths > sorted_depths[cut - 1]
+        self.held_chunks = [(depths[keep], tilts[keep], azimuths[keep])]
+
+    def resample(self, sample_intervals, progress=None):
+        if self.start_depth is None:
+            raise ValueError("No samples left after filtering")
+        if self.held_chunks is not None:
+            depths, tilts, azimuths = (np.concatenate(column) for column in zip(*self.held_chunks))
+            _, depths, tilts, azimuths = dedupe_samples(depths, tilts, azimuths, self.dedupe, self.dedupe_tolerance)
+            return resample_arrays(depths, tilts, azimuths, sample_intervals, self.method,
+                                   self.start_depth, self.end_depth, self.workers, progress)
+
+        target_depths = np.arange(int(self.start_depth), int(self.end_depth), sample_intervals)
+        if progress is not None:
+            progress(0, len(target_depths))
+        order = np.argsort(self.first_indices, kind="stable")
+        if self.method == "linear":
+            tilts, azimuths = resample_linear(self.keys[order], self.tilts[order], self.azimuths[order], target_depths)
+            return target_depths, tilts, azimuths
+        indices = order[nearest_sample_indices(self.keys[order], target_depths)]
+        return target_depths, self.tilts[indices], self.azimuths[indices]
+
+
+def stream_text_file(input_file, output_file, config, chunk_size=CHUNK_SIZE, metrics=None):
+    metrics = metrics or ConversionMetrics()
+    log = logReader.open_log(input_file)
+    chunks = logReader.read_chunks(log, chunk_size, lambda done, total: metrics.progress("read", done, total))
+    return convert_chunks(chunks, log.header, output_file, config, metrics, decimals=log.decimals)
+
+
+def stream_binary_log(input_file, output_file, config, chunk_size=CHUNK_SIZE, metrics=None):
+    metrics = metrics or ConversionMetrics()
+    log = binaryLog.open_binary_log(input_file)
+    usecols = find_columns(log.columns)
+    return convert_chunks(log.chunks(usecols, chunk_size), log.columns, output_file, config, metrics,
+                          total_rows=log.rows, decimals=tuple(log.decimals[i] for i in usecols[:2]))
+
+
+def timed_chunks(chunks, metrics, total_rows=None):
+    # Reading and parsing happen together inside the chunk generator, so both count as "read"
+    chunks = iter(chunks)
+    rows = 0
+    while True:
+        with metrics.stage("read") as stage:
+            chunk = next(chunks, None)
+            if chunk is not None:
+                stage["rows"] += len(chunk[0])
+        if chunk is None:
+            return
+        rows += len(chunk[0])
+        if total_rows:
+            metrics.progress("read", rows, total_rows)
+        yield chunk
+
+
+def convert_chunks(chunks, header, output_file, config, metrics=None, total_rows=None, decimals=(None, None)):
+    # decimals are the source file's depth and tilt decimals, see Survey
+    metrics = metrics or ConversionMetrics()
+    if config.sample_intervals == 0:
+        return pass_through_chunks(chunks, header, output_file, config, metrics, total_rows, decimals)
+
+    sample_filter = SampleFilter.from_config(config)
+    survey = resample_chunks(chunks, header, config, sample_filter, metrics, total_rows, decimals)
+
+    with metrics.stage("write") as stage:
+        create_csv_file(survey, survey.headers, output_file, config, metrics)
+        stage["rows"] += len(survey)
+    finish_filter(sample_filter, output_file, config)
+
+    return sample_filter.rows
+
+
+def resample_chunks(chunks, header, config, sample_filter, metrics, total_rows=None, decimals=(None, None)):
+    depth_col, tilt_col, azimuth_col = find_columns(header)
+    resampler = StreamingResampler(config.method, config.dedupe, config.dedupe_tolerance, config.resample_workers)
+    for depths, tilts, azimuths in sample_filter.filter_chunks(timed_chunks(chunks, metrics, total_rows), metrics):
+        with metrics.stage("dedupe") as stage:
+            resampler.add_chunk(depths, tilts, correct_azimuths(azimuths, config.declination))
+            stage["rows"] += len(depths)
+
+    with metrics.stage("resample") as stage:
+        depths, tilts, azimuths, *stats = resampler.resample(
+            config.sample_intervals, lambda done, total: metrics.progress("resample", done, total))
+        # Depths are on the integer grid; nearest tilts are source values unless averaged
+        copied = config.method == "nearest" and config.dedupe != "mean"
+        survey = Survey(depths, tilts, azimuths, [header[depth_col], header[tilt_col], header[azimuth_col]],
+                        config.hole_id, *stats, decimals=(None, decimals[1] if copied else None))
+        stage["rows"] += resampler.sample_count
+    logger.info(f"Total interpolated gyros: {len(survey)}")
+    return survey
+
+
+def pass_through_chunks(chunks, header, output_file, config, metrics=None, total_rows=None, decimals=(None, None)):
+    # sample_intervals == 0: every sample that survives the casing and range filters is
+    # written as it comes, in file order, without resampling or dedupe
+    metrics = metrics or ConversionMetrics()
+    depth_col, tilt_col, azimuth_col = find_columns(header)
+    headers = Gyro(depth=header[depth_col], tilt=header[tilt_col], azimuth=header[azimuth_col])
+
+    sample_filter = SampleFilter.from_config(config)
+    written = 0
+    with SurveyWriter(output_file, headers, config, decimals=decimals) as writer:
+        for depths, tilts, azimuths in sample_filter.filter_chunks(timed_chunks(chunks, metrics, total_rows), metrics):
+            with metrics.stage("write") as stage:
+                writer.write(depths, tilts, correct_azimuths(azimuths, config.declination))
+                stage["rows"] += len(depths)
+            written += len(depths)
+
+    logger.info(f"Total gyros (all data): {written}")
+    finish_filter(sample_filter, output_file, config)
+    return sample_filter.rows
 
 ############################################################################################################
 
-def create_csv_file(gyros, headers, output_file):
-    global hole_id, tool_name, project_code
-    with open(output_file, 'w', newline='') as outfile:
-        csv_writer = csv.writer(outfile)
-        csv_writer.writerow(["",headers.depth, headers.tilt, headers.azimuth])
-        for gyro in gyros:
-            if project_code is not None:
-                csv_writer.writerow([f"{project_code}_{hole_id}", gyro.depth, gyro.tilt, gyro.azimuth, tool_name])
-            else:
-                csv_writer.writerow([hole_id, gyro.depth, gyro.tilt, gyro.azimuth, tool_name])
+def create_csv_file(gyros, headers, output_file, config, metrics=None):
+    # gyros is a Survey or a list of Gyro records. Despite the name this writes whichever
+    # config.output_format asks for.
+    if isinstance(gyros, Survey):
+        progress = (lambda done, total: metrics.progress("write", done, total)) if metrics else None
+        with SurveyWriter(output_file, headers, config, gyros.binned, decimals=gyros.decimals,
+                          progress=progress) as writer:
+            writer.write(*gyros.values())
+        return
+
+    binned = bool(gyros) and isinstance(gyros[0], BinnedGyro)
+    with SurveyWriter(output_file, headers, config, binned) as writer:
+        if binned:
+            writer.write([g.depth for g in gyros], [g.tilt for g in gyros], [g.azimuth for g in gyros],
+                         [g.tilt_std for g in gyros], [g.azimuth_std for g in gyros], [g.count for g in gyros])
+        else:
+            writer.write([g.depth for g in gyros], [g.tilt for g in gyros], [g.azimuth for g in gyros])
+
+
+OUTPUT_EXTENSIONS = {"csv": "csv", "npz": "npz", "parquet": "parquet", "feather": "feather"}
+WRITE_BLOCK_ROWS = 65536
+
+
+def csv_field(value):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow([value])
+    return buffer.getvalue()
+
+
+class SurveyWriter:
+    # Writes converted surveys a block at a time. For CSV each block is one string
+    # formatting operation over a row template with the label and tool baked in. With
+    # precision=None values are written as str() of what was passed in, which is exactly
+    # what csv.writer produced, so the old layout comes out byte for byte. decimals are the
+    # source file's depth and tilt decimals (see Survey) and take the place of str() there.
+    def __init__(self, output_file, headers, config, binned=False, append=False, decimals=(None, None),
+                 progress=None):
+        self.output_file = output_file
+        self.headers = headers
+        self.config = config
+        self.binned = binned
+        self.decimals = decimals
+        # Called with (rows written, rows) before each CSV block
+        self.progress = progress
+        self.output_format = config.output_format
+        self.precision = config.precision
+        self.columns = [headers.depth, headers.tilt, headers.azimuth] + (BIN_STAT_HEADERS if binned else [])
+        self.outfile = None
+        self.blocks = []
+        self.arrow_writer = None
+
+        if self.output_format == "csv":
+            # Appending continues an existing CSV, so no header
+            self.outfile = open(output_file, 'a' if append else 'w', newline='')
+            header = ["", headers.depth, headers.tilt, headers.azimuth]
+            if binned:
+                header += [""] + BIN_STAT_HEADERS
+            if not append:
+                csv.writer(self.outfile).writerow(header)
+
+            self.angle = "%s" if self.precision is None else f"%.{self.precision}f"
+            self.label = csv_field(config.label()).replace("%", "%%")
+            self.tool = csv_field(config.tool_name).replace("%", "%%")
+        elif self.output_format not in OUTPUT_EXTENSIONS:
+            raise ValueError(f"Unknown output format: {self.output_format}")
+        elif self.output_format != "npz":
+            require_pyarrow(self.output_format)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, depths, tilts, azimuths, tilt_stds=None, azimuth_stds=None, counts=None):
+        columns = [depths, tilts, azimuths] + ([tilt_stds, azimuth_stds, counts] if self.binned else [])
+        if self.output_format == "csv":
+            self.write_csv(columns)
+        else:
+            self.write_arrays(columns)
+
+    def write_csv(self, columns):
+        if self.precision is not None:
+            columns = [columns[0]] + [np.asarray(column, dtype=np.float64) for column in columns[1:]]
+        rows = len(columns[0])
+        for start in range(0, rows, WRITE_BLOCK_ROWS):
+            if self.progress is not None:
+                self.progress(start, rows)
+            block = [column[start:start + WRITE_BLOCK_ROWS] for column in columns]
+            values = tuple(chain.from_iterable(zip(*(column.tolist() if isinstance(column, np.ndarray) else column
+                                                     for column in block))))
+            self.outfile.write(self.row_format(block) * len(block[0]) % values)
+
+    def row_format(self, block):
+        # Source decimals are only used when every value in the block has no more than that
+        # many, so nothing is rounded away
+        depth, tilt = "%s", self.angle
+        if self.decimals[0] is not None and fits_decimals(block[0], self.decimals[0]):
+            depth = f"%.{self.decimals[0]}f"
+        if self.precision is None and self.decimals[1] is not None and fits_decimals(block[1], self.decimals[1]):
+            tilt = f"%.{self.decimals[1]}f"
+        row_format = f"{self.label},{depth},{tilt},{self.angle},{self.tool}"
+        if self.binned:
+            row_format += f",{self.angle},{self.angle},%s"
+        return row_format + "\r\n"
+
+    def write_arrays(self, columns):
+        arrays = [np.asarray(column, dtype=np.float64) for column in columns]
+        if self.binned:
+            arrays[-1] = arrays[-1].astype(np.int64)
+        if self.output_format == "npz":
+            self.blocks.append(arrays)
+            return
+
+        table = arrow_table(self.columns, arrays, self.config)
+        if self.arrow_writer is None:
+            self.arrow_writer = open_arrow_writer(self.output_file, self.output_format, table.schema)
+        self.arrow_writer.write_table(table)
+
+    def close(self):
+        if self.outfile is not None:
+            self.outfile.close()
+            self.outfile = None
+        if self.output_format == "npz":
+            arrays = [np.concatenate(column) for column in zip(*self.blocks)] if self.blocks else \
+                [np.empty(0) for _ in self.columns]
+            with open(self.output_file, 'wb') as outfile:
+                # Hole ID and project code are kept apart as well as joined in the label
+                np.savez(outfile, label=np.array(self.config.label()), hole_id=np.array(self.config.hole_id),
+                         project_code=np.array(self.config.project_code or ""), tool=np.array(self.config.tool_name),
+                         columns=np.array(self.columns), **dict(zip(["depth", "tilt", "azimuth", "tilt_std",
+                                                                      "azimuth_std", "count"], arrays)))
+            self.blocks = []
+        if self.arrow_writer is not None:
+            self.arrow_writer.close()
+            self.arrow_writer = None
+
+
+def fits_decimals(values, decimals):
+    # True if writing the values with this many decimals gives back the same floats
+    return (isinstance(values, np.ndarray) and values.dtype.kind == "f"
+            and bool(np.array_equal(np.round(values, decimals), values)))
+
+
+def arrow_table(columns, arrays, config):
+    import pyarrow as pa
+    data = {"HOLE_ID": pa.array([config.label()] * len(arrays[0]), pa.string())}
+    data.update((name, array) for name, array in zip(columns, arrays))
+    data["TOOL"] = pa.array([config.tool_name] * len(arrays[0]), pa.string())
+    return pa.table(data)
+
+
+def require_pyarrow(output_format):
+    # pyarrow is optional; only parquet and feather output need it
+    if importlib.util.find_spec("pyarrow") is None:
+        raise ImportError(f"{output_format} output needs pyarrow (pip install pyarrow)")
+
+
+def open_arrow_writer(output_file, output_format, schema):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if output_format == "parquet":
+        return pq.ParquetWriter(output_file, schema)
+    return pa.ipc.new_file(output_file, schema)
 
 
 if __name__ == "__main__":
@@ -1,33 +1,30 @@
-import csv
-import numpy as np
+import logging
 import os
-from datetime import datetime
+import queue
+import threading
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import messagebox, ttk
 from tkinter.filedialog import askopenfilename
+from TeleviewerToGyro import ConversionCancelled, ConversionConfig, ConversionMetrics, create_output_file
+from resultCache import ResultCache
 
-sample_intervals = None
-casing_height = None
-declination = None
-tool_name = None
-hole_id = None
-project_code = None
-
-
-class Gyro:
-    def __init__(self, depth, tilt, azimuth):
-        self.depth = depth
-        self.tilt = tilt
-        self.azimuth = azimuth
-
-    def print_gyro(self):
-        print(f"Depth: {self.depth}, Tilt: {self.tilt}, Azimuth: {self.azimuth}")
+POLL_MS = 100
 
 
 class DrillingApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Gyro_Converter")
+        self.cache = ResultCache()
+        self.input_file_path = None
+
+        # Conversions run one at a time on a worker thread; it reports back via self.events,
+        # which the Tk loop drains every POLL_MS
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()
+        self.cancel_event = None
+        self.pending = 0
+        threading.Thread(target=self.worker, daemon=True).start()
 
         # Make the grid resizable
         root.grid_columnconfigure(0, weight=1)
@@ -73,6 +70,20 @@ class DrillingApp:
         # Submit button
         tk.Button(root, text="Submit", command=self.submit).grid(row=7, column=0, columnspan=2, pady=20, sticky="ew")
 
+        # Progress and cancel
+        self.progress_bar = ttk.Progressbar(root, mode="determinate", maximum=100)
+        self.progress_bar.grid(row=8, column=0, columnspan=2, padx=10, sticky="ew")
+        self.status_label = tk.Label(root, text="Idle", anchor="w")
+        self.status_label.grid(row=9, column=0, padx=10, pady=5, sticky="ew")
+        self.cancel_button = tk.Button(root, text="Cancel", command=self.cancel, state="disabled")
+        self.cancel_button.grid(row=9, column=1, sticky="ew")
+
+        # Queued files
+        self.queue_list = tk.Listbox(root, height=4)
+        self.queue_list.grid(row=10, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+
+        self.root.after(POLL_MS, self.poll)
+
     def browse_file(self):
         self.input_file_path = askopenfilename(filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
         if not self.input_file_path:
@@ -81,12 +92,12 @@ class DrillingApp:
             self.input_file_button.config(text=os.path.basename(self.input_file_path))
 
     def submit(self):
-        global declination, sample_intervals, casing_height, tool_name, hole_id, project_code
+        config = ConversionConfig()
 
         # Get and validate declination
         declination_input = self.declination_input.get().strip() or '19.1'
         try:
-            declination = float(declination_input)
+            config.declination = float(declination_input)
         except ValueError:
             messagebox.showerror("Input Error", "Please enter a valid declination value.")
             return
@@ -94,7 +105,7 @@ class DrillingApp:
         # Get and validate sample intervals
         sample_intervals_input = self.sample_intervals_input.get().strip() or '5'
         try:
-            sample_intervals = int(sample_intervals_input)
+            config.sample_intervals = int(sample_intervals_input)
         except ValueError:
             messagebox.showerror("Input Error", "Please enter a valid sample interval value.")
             return
@@ -102,166 +113,98 @@ class DrillingApp:
         # Get and validate casing height
         casing_height_input = self.casing_height_input.get().strip() or '15'
         try:
-            casing_height = float(casing_height_input)
+            config.casing_height = float(casing_height_input)
         except ValueError:
             messagebox.showerror("Input Error", "Please enter a valid casing height value.")
             return
 
         # Get tool name
-        tool_name = self.tool_name_input.get().strip().upper() or 'GYRO'
-        if not tool_name:
+        config.tool_name = self.tool_name_input.get().strip().upper() or 'GYRO'
+        if not config.tool_name:
             messagebox.showerror("Input Error", "Tool name cannot be empty.")
             return
 
         # Get hole ID
-        hole_id = self.hole_id_input.get().strip() or 'hole'
-        if not hole_id:
+        config.hole_id = self.hole_id_input.get().strip() or 'hole'
+        if not config.hole_id:
             messagebox.showerror("Input Error", "Hole ID cannot be empty.")
             return
 
         # Get project code (optional)
-        project_code = self.project_code_input.get().strip().upper() or None
+        config.project_code = self.project_code_input.get().strip().upper() or None
 
-        # Confirm and start the file processing
+        # Confirm and queue the file for processing
         if self.input_file_path:
-            create_output_file(self.input_file_path)
-            messagebox.showinfo("Success", "Conversion complete.")
+            self.pending += 1
+            self.queue_list.insert(tk.END, os.path.basename(self.input_file_path))
+            self.jobs.put((self.input_file_path, config))
         else:
             messagebox.showerror("Input Error", "Please select a valid input file.")
 
+    def cancel(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
 
-def create_output_file(input_file):
-    global hole_id, tool_name, project_code
-    file_counter = 1
-
-    input_file_directory = os.path.dirname(input_file)
-
-    if project_code:
-        output_file = os.path.join(input_file_directory, f"{project_code}_{hole_id}_Gy_{tool_name}_{file_counter}_{get_date()}.csv")
-    else:
-        output_file = os.path.join(input_file_directory, f"{hole_id}_Gy_{tool_name}_{file_counter}_{get_date()}.csv")
-
-    read_text_file(input_file, check_output_file(output_file, file_counter))
-
-
-def check_output_file(output_file, file_counter):
-    if os.path.exists(output_file):
+    def worker(self):
         while True:
-            file_counter += 1
-            output_file = output_file.replace(f"_{file_counter-1}_", f"_{file_counter}_")
-            if not os.path.exists(output_file):
-                return output_file
-    else:
-        return output_file
-
-
-def get_date():
-    return datetime.now().strftime("%m%d%Y")
-
-
-def read_text_file(input_file, output_file):
-    with open(input_file, 'r') as infile:
-        lines = infile.readlines()
-
-    create_data(lines, output_file)
-
-
-def create_data(lines, output_file):
-    global sample_intervals, casing_height
-    gyros = []
-    for line in lines:
-        cleaned_line = ' '.join(line.split())
-        if cleaned_line:
-            columns = cleaned_line.split()
-            gyro = create_obj(columns)
-            gyros.append(gyro)
-
-    final_gyros = calculate_interval(gyros, sample_intervals, casing_height)
-
-    create_csv_file(final_gyros, gyros[0], output_file)
-
-
-depth_index = None
-tilt_index = None
-azimuth_index = None
-
-
-def create_obj(columns):
-    global declination, depth_index, tilt_index, azimuth_index
-
-    if depth_index and tilt_index and azimuth_index is None:
-        return Gyro(depth=columns[depth_index], tilt=columns[tilt_index], azimuth=columns[azimuth_index])
-    for i, col in enumerate(columns):
-        if "DEPT" in col.upper():
-            depth_index = i
-        elif "TILT" in col.upper():
-            tilt_index = i
-        elif "AZIMUTH" in col.upper():
-            azimuth_index = i
-    try:
-        columns[azimuth_index] = str(float(columns[azimuth_index]) + declination)
-        if float(columns[azimuth_index]) > 360:
-            columns[azimuth_index] = azimuth_correction(columns[azimuth_index])
-        return Gyro(depth=columns[depth_index], tilt=columns[tilt_index], azimuth=columns[azimuth_index])
-    except (ValueError, IndexError):
-        return Gyro(depth=columns[depth_index], tilt=columns[tilt_index], azimuth=columns[azimuth_index])
-
-
-def azimuth_correction(azimuth):
-    return float(azimuth) - 360 if float(azimuth) > 360 else float(azimuth)
-
-
-def calculate_interval(gyros, sample_intervals, casing_height):
-    d_gyros = []
-    added_depth = []
-    final_gyros = []
-
-    for gyro in gyros[1:]:
-        if int(float(gyro.depth)) >= casing_height:
-            d_gyros.append(gyro)
-
-    for gyro in d_gyros:
-        if gyro.depth not in added_depth:
-            added_depth.append(gyro.depth)
-            final_gyros.append(gyro)
-
-    valid_gyros = []
-    for g in d_gyros:
-        if not (-1000 <= float(g.tilt) <= 1000 and -1000 <= float(g.azimuth) <= 1000):
-            continue  
-        valid_gyros.append(g)
-
-    final_gyros = valid_gyros
-
-    interpolated_gyros = []
-    start_depth = int(float(final_gyros[0].depth))
-    end_depth = int(float(final_gyros[-1].depth))
-
-    for depth in np.arange(start_depth, end_depth, sample_intervals):
-        closest_gyro = min(final_gyros, key=lambda g: abs(int(float(g.depth)) - depth))
-
-        interpolated_gyros.append(Gyro(depth=depth, tilt=closest_gyro.tilt, azimuth=closest_gyro.azimuth))
-
-        interpolated_gyros[-1].print_gyro()
-
-    print(f"Total interpolated gyros: {len(interpolated_gyros)}")
-
-    return interpolated_gyros
+            input_file, config = self.jobs.get()
+            cancel_event = threading.Event()
+            self.events.put(("start", input_file, cancel_event))
+            metrics = ConversionMetrics(
+                progress_callback=lambda stage, done, total: self.events.put(("progress", stage, done, total)),
+                cancel_event=cancel_event)
+            try:
+                output_file = create_output_file(input_file, config, self.cache, metrics)
+                metrics.log_summary()
+                self.events.put(("done", input_file, output_file))
+            except ConversionCancelled:
+                self.events.put(("cancelled", input_file, None))
+            except Exception as error:
+                logging.exception(f"Conversion of {input_file} failed")
+                self.events.put(("failed", input_file, error))
+
+    def poll(self):
+        try:
+            while True:
+                event = self.events.get_nowait()
+                self.handle_event(*event)
+        except queue.Empty:
+            pass
+        self.root.after(POLL_MS, self.poll)
+
+    def handle_event(self, kind, *details):
+        if kind == "progress":
+            stage, done, total = details
+            self.progress_bar["value"] = 100 * done / total if total else 0
+            self.status_label.config(text=f"{stage.capitalize()}: {done:,} / {total:,}")
+            return
 
+        if kind == "start":
+            input_file, self.cancel_event = details
+            self.progress_bar["value"] = 0
+            self.status_label.config(text=f"Converting {os.path.basename(input_file)}")
+            self.cancel_button.config(state="normal")
+            return
 
-def create_csv_file(gyros, headers, output_file):
-    global hole_id, tool_name, project_code
-    with open(output_file, 'w', newline='') as outfile:
-        csv_writer = csv.writer(outfile)
-        csv_writer.writerow(["", headers.depth, headers.tilt, headers.azimuth])
-        for gyro in gyros:
-            if project_code is not None:
-                csv_writer.writerow([f"{project_code}_{hole_id}", gyro.depth, gyro.tilt, gyro.azimuth, tool_name])
-            else:
-                csv_writer.writerow([hole_id, gyro.depth, gyro.tilt, gyro.azimuth, tool_name])
+        input_file, result = details
+        self.pending -= 1
+        self.queue_list.delete(0)
+        self.cancel_event = None
+        self.cancel_button.config(state="disabled")
+        self.progress_bar["value"] = 0
+        if kind == "done":
+            self.status_label.config(text=f"Saved {os.path.basename(result)}")
+            if self.pending == 0:
+                messagebox.showinfo("Success", "Conversion complete.")
+        elif kind == "cancelled":
+            self.status_label.config(text=f"Cancelled {os.path.basename(input_file)}")
+        else:
+            self.status_label.config(text=f"Failed {os.path.basename(input_file)}")
+            messagebox.showerror("Conversion Error", f"{os.path.basename(input_file)}: {result}")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     root = tk.Tk()
     app = DrillingApp(root)
     root.mainloop()
@@ -0,0 +1,186 @@
+import argparse
+import copy
+import csv
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import binaryLog
+from surveyStore import SurveyStore
+from TeleviewerToGyro import (DEDUPE_POLICIES, NULL_VALUES, OUTPUT_EXTENSIONS, RESAMPLING_METHODS, ConversionConfig,
+                              ConversionMetrics, check_output_file, output_file_name, stream_binary_log, stream_text_file)
+
+
+class BatchJob:
+    def __init__(self, input_file, config):
+        self.input_file = input_file
+        self.config = config
+        self.output_file = None
+
+
+def jobs_from_directory(directory, defaults, pattern="*.txt"):
+    jobs = []
+    for input_file in sorted(glob.glob(os.path.join(directory, pattern))):
+        hole_id = os.path.splitext(os.path.basename(input_file))[0]
+        config = copy.copy(defaults)
+        config.hole_id = hole_id
+        jobs.append(BatchJob(input_file, config))
+    return jobs
+
+
+def jobs_from_manifest(manifest_file, defaults):
+    # Columns: file, hole_id, declination, casing_height, interval, tool, project_code.
+    # Blank cells fall back to the defaults; relative paths are relative to the manifest.
+    manifest_directory = os.path.dirname(os.path.abspath(manifest_file))
+    jobs = []
+    with open(manifest_file, 'r', newline='') as infile:
+        for row in csv.DictReader(infile):
+            row = {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+            if not row.get("file"):
+                continue
+            input_file = os.path.join(manifest_directory, row["file"])
+            config = copy.copy(defaults)
+            config.hole_id = row.get("hole_id") or os.path.splitext(os.path.basename(input_file))[0]
+            config.tool_name = (row.get("tool") or defaults.tool_name).upper()
+            config.project_code = (row.get("project_code") or "").upper() or defaults.project_code
+            if row.get("declination"):
+                config.declination = float(row["declination"])
+            if row.get("casing_height"):
+                config.casing_height = float(row["casing_height"])
+            if row.get("interval"):
+                config.sample_intervals = int(row["interval"])
+            jobs.append(BatchJob(input_file, config))
+    return jobs
+
+
+def reserve_output_files(jobs):
+    # Names are picked here, one at a time, and claimed on disk before any worker starts,
+    # so two holes that map to the same name still get separate _N_ copies
+    for job in jobs:
+        job.output_file = check_output_file(output_file_name(job.input_file, job.config), 1)
+        open(job.output_file, 'w').close()
+
+
+def convert_job(job):
+    metrics = ConversionMetrics()
+    if job.input_file.endswith(binaryLog.EXTENSION):
+        rows = stream_binary_log(job.input_file, job.output_file, job.config, metrics=metrics)
+    else:
+        rows = stream_text_file(job.input_file, job.output_file, job.config, metrics=metrics)
+    return rows, metrics.report(input_file=job.input_file, output_file=job.output_file)
+
+
+def run_batch(jobs, max_workers=None, metrics_file=None, store_file=None):
+    reserve_output_files(jobs)
+    total_rows = 0
+    total_bytes = 0
+    failures = 0
+    reports = []
+    converted_jobs = []
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(convert_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                rows, report = future.result()
+            except Exception as error:
+                failures += 1
+                os.remove(job.output_file)
+                print(f"FAILED {job.input_file}: {error}")
+                continue
+            converted_jobs.append(job)
+            total_rows += rows
+            total_bytes += os.path.getsize(job.input_file)
+            reports.append(report)
+            print(f"{job.input_file} -> {job.output_file} ({rows} rows in {report['total_seconds']:.2f} s)")
+            for name, stage in report["stages"].items():
+                logging.debug(f"  {name}: {stage['seconds']:.3f} s, {stage['rows']} rows")
+    elapsed = time.perf_counter() - start
+
+    converted = len(jobs) - failures
+    print(f"Converted {converted} of {len(jobs)} holes in {elapsed:.2f} s: "
+          f"{converted / elapsed:.2f} holes/s, {total_rows / elapsed:,.0f} rows/s, "
+          f"{total_bytes / 1e6 / elapsed:.1f} MB/s")
+
+    if store_file:
+        # SQLite takes one writer at a time, so surveys are ingested here and not in the workers
+        with SurveyStore(store_file) as store:
+            for job in converted_jobs:
+                try:
+                    store.ingest_file(job.output_file, job.config.hole_id, job.config.project_code)
+                except ValueError as error:
+                    print(f"Not stored: {error}")
+
+    if metrics_file:
+        with open(metrics_file, 'w') as outfile:
+            json.dump({"holes": len(jobs), "failures": failures, "seconds": elapsed, "rows": total_rows,
+                       "bytes": total_bytes, "jobs": reports}, outfile, indent=2)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a directory or manifest of televiewer exports in parallel")
+    parser.add_argument("source", help="directory of exports, or a manifest CSV")
+    parser.add_argument("--pattern", default="*.txt", help="file pattern when source is a directory")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--declination", type=float, default=19.1)
+    parser.add_argument("--casing-height", type=float, default=15.0)
+    parser.add_argument("--interval", type=int, default=5)
+    parser.add_argument("--tool", default="GYRO")
+    parser.add_argument("--project-code", default=None)
+    parser.add_argument("--method", choices=RESAMPLING_METHODS, default="nearest",
+                        help="nearest sample, linear interpolation, or bin statistics per interval")
+    parser.add_argument("--dedupe", choices=DEDUPE_POLICIES, default="first",
+                        help="which sample to keep when depths repeat")
+    parser.add_argument("--dedupe-tolerance", type=float, default=0.0,
+                        help="group depths that step by no more than this, e.g. half the step for overlapping passes")
+    parser.add_argument("--null-values", type=float, nargs="*", default=list(NULL_VALUES),
+                        help="sentinel values that mark a missing sample; NaN and blanks always do")
+    parser.add_argument("--tilt-range", type=float, nargs=2, default=(-1000.0, 1000.0), metavar=("MIN", "MAX"))
+    parser.add_argument("--azimuth-range", type=float, nargs=2, default=(-1000.0, 1000.0), metavar=("MIN", "MAX"))
+    parser.add_argument("--spike-window", type=int, default=0,
+                        help="samples in the rolling median/MAD spike test; 0 turns it off")
+    parser.add_argument("--spike-threshold", type=float, default=3.5, help="robust standard deviations")
+    parser.add_argument("--spike-floor", type=float, default=0.5, help="never flag deviations below this, degrees")
+    parser.add_argument("--report-rejected", action="store_true",
+                        help="write rejected rows next to each output as *_rejected.csv")
+    parser.add_argument("--format", choices=sorted(OUTPUT_EXTENSIONS), default="csv",
+                        help="parquet and feather need pyarrow")
+    parser.add_argument("--precision", type=int, default=None,
+                        help="decimals for tilt and azimuth; default writes values unrounded")
+    parser.add_argument("--resample-workers", type=int, default=1,
+                        help="processes per hole for resampling very long logs; output is the same")
+    parser.add_argument("--store", default=None, help="also add every converted survey to this SQLite survey store")
+    parser.add_argument("--metrics", default=None, help="write per-hole, per-stage timings to this JSON file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log per-stage timings for every hole")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, format="%(message)s")
+
+    defaults = ConversionConfig(tool_name=args.tool.upper(),
+                                project_code=args.project_code.upper() if args.project_code else None,
+                                declination=args.declination, casing_height=args.casing_height,
+                                sample_intervals=args.interval, method=args.method, dedupe=args.dedupe,
+                                dedupe_tolerance=args.dedupe_tolerance, output_format=args.format,
+                                precision=args.precision, null_values=tuple(args.null_values),
+                                tilt_range=tuple(args.tilt_range), azimuth_range=tuple(args.azimuth_range),
+                                spike_window=args.spike_window, spike_threshold=args.spike_threshold,
+                                spike_floor=args.spike_floor, report_rejected=args.report_rejected,
+                                resample_workers=args.resample_workers)
+    if os.path.isdir(args.source):
+        jobs = jobs_from_directory(args.source, defaults, args.pattern)
+    else:
+        jobs = jobs_from_manifest(args.source, defaults)
+
+    if not jobs:
+        print(f"No input files found in {args.source}")
+        return 1
+    return 1 if run_batch(jobs, args.workers, args.metrics, args.store) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+
+import logReader
+import TeleviewerToGyro as converter
+
+
+def write_scaled_gyro_file(output_file, rows, template_file="gyro.txt"):
+    # Tile the real gyro.txt samples out to `rows` lines, 1 cm apart, in the same layout
+    log = logReader.open_log(template_file)
+    with open(template_file, 'r') as infile:
+        lines = infile.readlines()[log.data_line:]
+    header = log.columns
+    values = np.column_stack(logReader.parse_rows(lines, range(len(header))))
+    depth_col = log.column_map.depth
+    repeats = -(-rows // len(values))
+    data = np.tile(values, (repeats, 1))[:rows]
+    data[:, depth_col] = values[0, depth_col] + np.arange(rows) * 0.01
+
+    write_log(output_file, header, data)
+
+
+LOG_ROW_FORMAT = "%12.4f%12.3f%12.4f%12.3f\r\n"
+LOG_BLOCK_ROWS = 65536
+NULL_VALUE = -999.25
+OUT_OF_RANGE_VALUE = 99999.0
+
+
+def write_log(output_file, header, data):
+    # Same layout as gyro.txt: blank first line, right-aligned 12-wide columns, CRLF
+    with open(output_file, 'w', newline='') as outfile:
+        outfile.write("\r\n" + "".join(f"{name:>12}" for name in header) + "\r\n")
+        for start in range(0, len(data), LOG_BLOCK_ROWS):
+            block = data[start:start + LOG_BLOCK_ROWS]
+            outfile.write(LOG_ROW_FORMAT * len(block) % tuple(block.ravel().tolist()))
+
+
+def write_synthetic_log(output_file, rows, step=0.01, start_depth=14.3069, noise=0.05, duplicate_rate=0.0,
+                        null_rate=0.0, seed=0):
+    # A hole that drifts slowly in tilt and azimuth, with gaussian noise on both.
+    # duplicate_rate of the rows repeat the previous depth (overlapping passes); null_rate of
+    # them carry a -999.25 null or an out-of-range 99999 in tilt or azimuth.
+    random = np.random.default_rng(seed)
+    depths = start_depth + np.arange(rows) * step
+    if duplicate_rate and rows > 1:
+        repeated = random.choice(np.arange(1, rows), int((rows - 1) * duplicate_rate), replace=False)
+        depths[np.sort(repeated)] = depths[np.sort(repeated) - 1]
+    tilts = 40.0 + 2.0 * np.sin(depths / 50.0) + random.normal(0.0, noise, rows)
+    azimuths = (351.0 + depths * 0.05 + random.normal(0.0, noise, rows)) % 360.0
+    rolls = random.uniform(0.0, 360.0, rows)
+
+    data = np.column_stack((depths, rolls, tilts, azimuths))
+    if null_rate:
+        bad = random.choice(rows, int(rows * null_rate), replace=False)
+        data[bad, random.choice([2, 3], len(bad))] = random.choice([NULL_VALUE, OUT_OF_RANGE_VALUE], len(bad))
+    write_log(output_file, ["DEPT[M]", "ROLL_(ATV)", "TILT_(ATV)", "AZIMUTH_(A"], data)
+
+
+def per_line_load(input_file):
+    with open(input_file, 'r') as infile:
+        lines = infile.readlines()
+    column_map = None
+    gyros = []
+    for line in lines:
+        columns = line.split()
+        if columns:
+            column_map = column_map or converter.find_columns(columns)
+            gyros.append(converter.create_obj(columns, column_map))
+    return [(float(g.depth), float(g.tilt), float(g.azimuth)) for g in gyros[1:]]
+
+
+def chunked_load(input_file):
+    return list(logReader.read_chunks(logReader.open_log(input_file)))
+
+
+def bulk_load(input_file):
+    # The whole file as one chunk
+    log = logReader.open_log(input_file)
+    return list(logReader.read_chunks(log, chunk_size=os.path.getsize(input_file)))
+
+
+def benchmark_load(rows, repeat=3):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_file = os.path.join(temp_dir, "gyro.txt")
+        write_scaled_gyro_file(input_file, rows)
+        size_mb = os.path.getsize(input_file) / 1e6
+        print(f"{rows} rows, {size_mb:.1f} MB")
+
+        for name, load in (("per-line", per_line_load), ("chunked", chunked_load), ("bulk", bulk_load)):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                load(input_file)
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            print(f"{name:>10}: {best:8.3f} s  {rows / best:12,.0f} rows/s")
+
+
+# Metrics stages grouped by the pipeline step they run in. Reading includes parsing, which
+# happens inside the chunk reader.
+PIPELINE_FUNCTIONS = {"read_chunks": ("read",), "SampleFilter": ("filter",),
+                      "StreamingResampler": ("dedupe", "resample"), "create_csv_file": ("write",)}
+
+
+def peak_rss_mb():
+    # High-water mark of this process. resource is not available on Windows.
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if platform.system() == "Darwin" else peak / 1e3
+
+
+def run_pipeline(input_file, output_file, config):
+    # Runs in a fresh worker process so peak RSS belongs to this conversion alone
+    metrics = converter.ConversionMetrics()
+    converter.stream_text_file(input_file, output_file, config, metrics=metrics)
+    report = metrics.report()
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def benchmark_pipeline(row_counts, config=None, repeat=1, **generator_options):
+    config = config or converter.ConversionConfig()
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for rows in row_counts:
+            input_file = os.path.join(temp_dir, f"synthetic_{rows}.txt")
+            start = time.perf_counter()
+            write_synthetic_log(input_file, rows, **generator_options)
+            generate_seconds = time.perf_counter() - start
+            size_mb = os.path.getsize(input_file) / 1e6
+
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                    output_file = os.path.join(temp_dir, f"out_{rows}.csv")
+                    runs.append(executor.submit(run_pipeline, input_file, output_file, config).result())
+            report = min(runs, key=lambda run: run["total_seconds"])
+
+            functions = {}
+            for function, stage_names in PIPELINE_FUNCTIONS.items():
+                stages = [report["stages"][name] for name in stage_names if name in report["stages"]]
+                if stages:
+                    seconds = sum(stage["seconds"] for stage in stages)
+                    functions[function] = {"seconds": seconds, "rows_per_second": rows / seconds if seconds else None}
+            result = {"rows": rows, "megabytes": size_mb, "generate_seconds": generate_seconds,
+                      "total_seconds": report["total_seconds"], "rows_per_second": rows / report["total_seconds"],
+                      "peak_rss_mb": report["peak_rss_mb"], "functions": functions, "stages": report["stages"]}
+            results.append(result)
+
+            rss = f"{result['peak_rss_mb']:8.1f} MB" if result["peak_rss_mb"] is not None else "       n/a"
+            print(f"{rows:>10}: {result['total_seconds']:8.3f} s  "
+                  f"{result['rows_per_second']:12,.0f} rows/s  peak {rss}")
+            for function, timing in functions.items():
+                print(f"{'':>12}{function:>18}: {timing['seconds']:8.3f} s")
+    return results
+
+
+def resample_samples(rows, step=0.01, seed=0):
+    # Depth-sorted samples at a fixed spacing, the arrays resample_arrays sees for a clean log
+    random = np.random.default_rng(seed)
+    depths = 14.3069 + np.arange(rows) * step
+    tilts = 40.0 + 2.0 * np.sin(depths / 50.0) + random.normal(0.0, 0.05, rows)
+    azimuths = (351.0 + depths * 0.05 + random.normal(0.0, 0.05, rows)) % 360.0
+    return depths, tilts, azimuths
+
+
+def best_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_resample(row_counts, methods=converter.RESAMPLING_METHODS, worker_counts=(2, 4), interval=1,
+                       step=0.01, repeat=3):
+    # Serial resample_arrays against the windowed path forced on. The windowed time less the
+    # serial share of each worker (as far as there are cores for them) is the overhead: pool
+    # start-up and the copy into shared memory. A line through it against rows gives a fixed
+    # and a per-row part, and windows pay off for w workers on idle cores once
+    #     rows * serial_per_row * (1 - 1/w) > fixed + rows * overhead_per_row
+    cores = os.cpu_count() or 1
+    results = []
+    for method in methods:
+        runs = []
+        for rows in row_counts:
+            depths, tilts, azimuths = resample_samples(rows, step)
+            target_range = (int(np.min(depths)), int(np.max(depths)), interval)
+            serial = best_time(lambda: converter.resample_arrays(depths, tilts, azimuths, interval, method,
+                                                                 workers=1), repeat)
+            run = {"rows": rows, "serial_seconds": serial, "windowed_seconds": {}, "overhead_seconds": {}}
+            for workers in worker_counts:
+                windowed = best_time(lambda: converter.resample_windows(depths, tilts, azimuths, target_range, method,
+                                                                        workers, workers), repeat)
+                run["windowed_seconds"][workers] = windowed
+                run["overhead_seconds"][workers] = windowed - serial / min(workers, cores)
+            runs.append(run)
+            print(f"{method:>10} {rows:>10}: serial {serial:8.4f} s  {serial / rows * 1e6:7.3f} us/row  " +
+                  "  ".join(f"{workers}w {run['windowed_seconds'][workers]:8.4f} s" for workers in worker_counts))
+
+        # Serial cost per row from the longest log; overhead line from the smallest worker count
+        serial_per_row = runs[-1]["serial_seconds"] / runs[-1]["rows"]
+        overhead_per_row, fixed = np.polyfit([run["rows"] for run in runs],
+                                              [run["overhead_seconds"][worker_counts[0]] for run in runs], 1)
+        fixed = max(fixed, 0.0)
+        break_even = {}
+        for workers in worker_counts:
+            saved_per_row = serial_per_row * (1 - 1 / workers) - max(overhead_per_row, 0.0)
+            break_even[workers] = int(fixed / saved_per_row) if saved_per_row > 0 else None
+        print(f"{method:>10}: fixed overhead {fixed:.4f} s, {max(overhead_per_row, 0.0) * 1e9:.1f} ns/row; "
+              "break-even on idle cores " + ", ".join(f"{workers}w {rows if rows is not None else 'never'}"
+                                                       for workers, rows in break_even.items()))
+        results.append({"method": method, "serial_us_per_row": serial_per_row * 1e6, "fixed_overhead_seconds": fixed,
+                        "overhead_ns_per_row": max(overhead_per_row, 0.0) * 1e9, "break_even_rows": break_even,
+                        "runs": runs})
+    print(f"{cores} core(s) here; windowed runs share them, so speed-ups need that many idle cores")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the televiewer converter on synthetic exports")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load_parser = commands.add_parser("load", help="time the text loaders on scaled gyro.txt data")
+    load_parser.add_argument("--rows", type=int, default=1000000)
+    load_parser.add_argument("--repeat", type=int, default=3)
+
+    pipeline_parser = commands.add_parser("pipeline", help="time each conversion stage on synthetic logs")
+    pipeline_parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000],
+                                 help="log lengths to run, e.g. 10000 100000 1000000 10000000")
+    pipeline_parser.add_argument("--repeat", type=int, default=1, help="best of this many runs")
+    pipeline_parser.add_argument("--interval", type=int, default=5)
+    pipeline_parser.add_argument("--method", choices=converter.RESAMPLING_METHODS, default="nearest")
+    pipeline_parser.add_argument("--workers", type=int, default=1, help="resampling processes; 0 uses every core")
+    pipeline_parser.add_argument("--step", type=float, default=0.01, help="sample spacing in metres")
+    pipeline_parser.add_argument("--noise", type=float, default=0.05, help="std dev of tilt/azimuth noise, degrees")
+    pipeline_parser.add_argument("--duplicates", type=float, default=0.0, help="fraction of rows repeating a depth")
+    pipeline_parser.add_argument("--nulls", type=float, default=0.0, help="fraction of rows with null/out-of-range values")
+    pipeline_parser.add_argument("--seed", type=int, default=0)
+    pipeline_parser.add_argument("--label", default=None, help="version tag stored with the results")
+    pipeline_parser.add_argument("--json", default=None, help="write the results to this JSON file")
+    resample_parser = commands.add_parser("resample", help="time serial against windowed resampling per method")
+    resample_parser.add_argument("--rows", type=int, nargs="+", default=[30000, 100000, 300000, 1000000])
+    resample_parser.add_argument("--methods", nargs="+", choices=converter.RESAMPLING_METHODS,
+                                 default=list(converter.RESAMPLING_METHODS))
+    resample_parser.add_argument("--workers", type=int, nargs="+", default=[2, 4], help="window counts to time")
+    resample_parser.add_argument("--interval", type=int, default=1)
+    resample_parser.add_argument("--step", type=float, default=0.01, help="sample spacing in metres")
+    resample_parser.add_argument("--repeat", type=int, default=3, help="best of this many runs")
+    resample_parser.add_argument("--json", default=None, help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.command == "load":
+        benchmark_load(args.rows, args.repeat)
+    elif args.command == "resample":
+        results = benchmark_resample(args.rows, args.methods, args.workers, args.interval, args.step, args.repeat)
+        if args.json:
+            with open(args.json, 'w') as outfile:
+                json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                           "numpy": np.__version__, "platform": platform.platform(), "cores": os.cpu_count(),
+                           "interval": args.interval, "step": args.step, "results": results}, outfile, indent=2)
+    else:
+        config = converter.ConversionConfig(sample_intervals=args.interval, method=args.method,
+                                            resample_workers=args.workers)
+        results = benchmark_pipeline(args.rows, config, args.repeat, step=args.step, noise=args.noise,
+                                     duplicate_rate=args.duplicates, null_rate=args.nulls, seed=args.seed)
+        if args.json:
+            with open(args.json, 'w') as outfile:
+                json.dump({"label": args.label, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                           "python": platform.python_version(), "numpy": np.__version__,
+                           "platform": platform.platform(), "interval": args.interval, "method": args.method,
+                           "generator": {"step": args.step, "noise": args.noise, "duplicates": args.duplicates,
+                                         "nulls": args.nulls, "seed": args.seed},
+                           "results": results}, outfile, indent=2)
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import shutil
+import struct
+import tempfile
+import numpy as np
+
+import logReader
+
+# File layout: 8-byte magic, uint32 little-endian JSON metadata length, the JSON metadata,
+# zero padding up to DATA_ALIGNMENT, then one contiguous block per column (all rows of the
+# first column, then all rows of the second, ...). Columns are read back with np.memmap.
+MAGIC = b"TVLOG001"
+DATA_ALIGNMENT = 4096
+EXTENSION = ".tvlog"
+CHUNK_SIZE = 100000
+MAX_DECIMALS = 10
+
+
+class BinaryLog:
+    def __init__(self, path, metadata, data):
+        self.path = path
+        self.metadata = metadata
+        self.columns = metadata["columns"]
+        self.hole_id = metadata.get("hole_id")
+        self.rows = metadata["rows"]
+        # Decimals of each column in the text export, None where not known (older files)
+        self.decimals = metadata.get("decimals") or [None] * len(self.columns)
+        self.data = data
+
+    def column(self, name):
+        index = name if isinstance(name, int) else self.columns.index(name)
+        return self.values(index)
+
+    def values(self, index, start=0, stop=None):
+        # float64 columns are views over the mapped file; float32 ones see shortest_decimals
+        column = self.data[index, start:stop]
+        if column.dtype.itemsize < 8 and self.decimals[index] is not None:
+            return shortest_decimals(column, self.decimals[index])
+        return column
+
+    def chunks(self, column_indices, chunk_size=CHUNK_SIZE):
+        # Only the pages in each slice are read from disk
+        for start in range(0, self.rows, chunk_size):
+            yield tuple(self.values(i, start, start + chunk_size) for i in column_indices)
+
+
+def shortest_decimals(column, decimals):
+    # float32 cannot hold 38.9 exactly. Each value comes back as float64 with the fewest
+    # decimals, up to those of the text export, that give the same float32, which is the
+    # number in the export wherever float32 can tell it from its neighbours.
+    values = column.astype(np.float64)
+    pending = np.flatnonzero(~np.isnan(values))
+    for places in range(decimals + 1):
+        rounded = np.round(values[pending], places)
+        found = rounded.astype(column.dtype) == column[pending]
+        values[pending[found]] = rounded[found]
+        pending = pending[~found]
+        if len(pending) == 0:
+            break
+    return values
+
+
+def data_offset(metadata_length):
+    used = len(MAGIC) + 4 + metadata_length
+    return -(-used // DATA_ALIGNMENT) * DATA_ALIGNMENT
+
+
+def read_metadata(path):
+    with open(path, 'rb') as infile:
+        if infile.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a televiewer binary log")
+        (length,) = struct.unpack("<I", infile.read(4))
+        metadata = json.loads(infile.read(length).decode("utf-8"))
+    return metadata, data_offset(length)
+
+
+def open_binary_log(path):
+    metadata, offset = read_metadata(path)
+    shape = (len(metadata["columns"]), metadata["rows"])
+    if metadata["rows"] == 0:
+        data = np.empty(shape, dtype=metadata["dtype"])
+    else:
+        data = np.memmap(path, dtype=metadata["dtype"], mode='r', offset=offset, shape=shape)
+    return BinaryLog(path, metadata, data)
+
+
+def write_binary_log(output_file, columns, column_files, rows, dtype, hole_id=None, source=None, decimals=None):
+    metadata = json.dumps({"version": 1, "hole_id": hole_id, "columns": columns, "dtype": np.dtype(dtype).str,
+                           "rows": rows, "source": source, "decimals": decimals}).encode("utf-8")
+    with open(output_file, 'wb') as outfile:
+        outfile.write(MAGIC)
+        outfile.write(struct.pack("<I", len(metadata)))
+        outfile.write(metadata)
+        outfile.write(b"\0" * (data_offset(len(metadata)) - outfile.tell()))
+        for column_file in column_files:
+            with open(column_file, 'rb') as infile:
+                shutil.copyfileobj(infile, outfile, 16 * 1024 * 1024)
+
+
+def widen_decimals(decimals, values):
+    # Decimals the values need, starting from those read off the first rows, so a value
+    # further down with more digits is not rounded away. None if past MAX_DECIMALS.
+    values = values[~np.isnan(values)]
+    while decimals is not None and not np.array_equal(np.round(values, decimals), values):
+        decimals = decimals + 1 if decimals < MAX_DECIMALS else None
+    return decimals
+
+
+def import_text_file(input_file, output_file=None, hole_id=None, dtype=np.float64, chunk_size=CHUNK_SIZE):
+    # One pass over the text export. Each column is spooled to its own temporary file and the
+    # pieces are then copied into place, so memory stays at one chunk whatever the file size.
+    if output_file is None:
+        output_file = os.path.splitext(input_file)[0] + EXTENSION
+    output_directory = os.path.dirname(os.path.abspath(output_file))
+
+    with tempfile.TemporaryDirectory(dir=output_directory) as temp_dir, open(input_file, 'r') as infile:
+        columns = None
+        column_files = []
+        spools = []
+        rows = 0
+        decimals = None
+        lines = []
+
+        def flush():
+            nonlocal rows, decimals
+            if decimals is None:
+                decimals = logReader.column_decimals(lines[:logReader.DECIMALS_ROWS], range(len(columns)))
+            values = logReader.parse_rows(lines, range(len(columns)))
+            decimals = [widen_decimals(places, column) for places, column in zip(decimals, values)]
+            for spool, column in zip(spools, values):
+                spool.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+            rows += len(values[0])
+            lines.clear()
+
+        for line in infile:
+            if columns is None:
+                columns = line.split() or None
+                if columns:
+                    column_files = [os.path.join(temp_dir, f"{i}.bin") for i in range(len(columns))]
+                    spools = [open(path, 'wb') for path in column_files]
+                continue
+            if line.isspace():
+                continue
+            lines.append(line)
+            if len(lines) >= chunk_size:
+                flush()
+        if columns is None:
+            raise ValueError(f"No header found in {input_file}")
+        if lines:
+            flush()
+        for spool in spools:
+            spool.close()
+
+        write_binary_log(output_file, columns, column_files, rows, dtype,
+                         hole_id=hole_id, source=os.path.basename(input_file), decimals=decimals)
+    return output_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a televiewer text export to a memory-mapped binary log")
+    parser.add_argument("input_file")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--hole-id", default=None)
+    parser.add_argument("--float32", action="store_true",
+                        help="store float32 columns instead of float64; about 7 significant digits")
+    args = parser.parse_args()
+
+    output = import_text_file(args.input_file, args.output, args.hole_id, np.float32 if args.float32 else np.float64)
+    print(f"Import complete. Output saved to: {output}")
@@ -0,0 +1,92 @@
+import argparse
+import os
+import numpy as np
+
+from TeleviewerToGyro import Survey
+
+
+def minimum_curvature(depths, tilts, azimuths, easting=0.0, northing=0.0, elevation=0.0, dogleg_length=30.0,
+                      collar_depth=0.0):
+    # Tilt is the televiewer tilt, i.e. inclination from vertical in degrees.
+    # Returns easting, northing, elevation per station and dogleg severity in degrees per
+    # dogleg_length metres for the interval ending at each station (0 at the first one).
+    # The collar coordinates are at collar_depth. Converted surveys start below the casing,
+    # so the hole above the first station is taken as straight at that station's tilt and
+    # azimuth, through a collar station that is left out of the result.
+    depths = np.asarray(depths, dtype=np.float64)
+    inclination = np.radians(np.asarray(tilts, dtype=np.float64))
+    azimuth = np.radians(np.asarray(azimuths, dtype=np.float64))
+    if len(depths) == 0:
+        return np.empty(0), np.empty(0), np.empty(0), np.empty(0)
+    from_collar = depths[0] > collar_depth
+    if from_collar:
+        depths = np.concatenate(([collar_depth], depths))
+        inclination = np.concatenate((inclination[:1], inclination))
+        azimuth = np.concatenate((azimuth[:1], azimuth))
+
+    i1, i2 = inclination[:-1], inclination[1:]
+    a1, a2 = azimuth[:-1], azimuth[1:]
+    course_length = np.diff(depths)
+
+    cos_dogleg = np.cos(i2 - i1) - np.sin(i1) * np.sin(i2) * (1 - np.cos(a2 - a1))
+    dogleg = np.arccos(np.clip(cos_dogleg, -1.0, 1.0))
+
+    # Ratio factor 2/DL * tan(DL/2) tends to 1 for straight intervals
+    ratio = np.ones_like(dogleg)
+    bent = dogleg > 1e-9
+    ratio[bent] = 2 / dogleg[bent] * np.tan(dogleg[bent] / 2)
+
+    half_step = course_length / 2 * ratio
+    d_north = half_step * (np.sin(i1) * np.cos(a1) + np.sin(i2) * np.cos(a2))
+    d_east = half_step * (np.sin(i1) * np.sin(a1) + np.sin(i2) * np.sin(a2))
+    d_vertical = half_step * (np.cos(i1) + np.cos(i2))
+
+    eastings = easting + np.concatenate(([0.0], np.cumsum(d_east)))
+    northings = northing + np.concatenate(([0.0], np.cumsum(d_north)))
+    elevations = elevation - np.concatenate(([0.0], np.cumsum(d_vertical)))
+
+    dogleg_severity = np.zeros_like(depths)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dogleg_severity[1:] = np.where(course_length > 0, np.degrees(dogleg) * dogleg_length / course_length, 0.0)
+
+    if from_collar:
+        return eastings[1:], northings[1:], elevations[1:], dogleg_severity[1:]
+    return eastings, northings, elevations, dogleg_severity
+
+
+def desurvey_gyros(gyros, easting=0.0, northing=0.0, elevation=0.0, dogleg_length=30.0, collar_depth=0.0):
+    # Takes a Survey, or a list of Gyro records
+    if not isinstance(gyros, Survey):
+        gyros = Survey.from_gyros(gyros)
+    depths, tilts, azimuths = gyros.depths, gyros.tilts, gyros.azimuths
+    return depths, tilts, azimuths, minimum_curvature(depths, tilts, azimuths, easting, northing, elevation, dogleg_length,
+                                                      collar_depth)
+
+
+def desurvey_csv(input_file, output_file, easting=0.0, northing=0.0, elevation=0.0, dogleg_length=30.0,
+                 collar_depth=0.0):
+    # Reads a converted survey written by create_csv_file (label, depth, tilt, azimuth, tool)
+    depths, tilts, azimuths = np.loadtxt(input_file, delimiter=",", skiprows=1, usecols=(1, 2, 3), ndmin=2, unpack=True)
+    eastings, northings, elevations, dogleg_severity = minimum_curvature(
+        depths, tilts, azimuths, easting, northing, elevation, dogleg_length, collar_depth)
+
+    with open(output_file, 'w', newline='') as outfile:
+        outfile.write("DEPTH,TILT,AZIMUTH,EASTING,NORTHING,ELEVATION,DLS\n")
+        np.savetxt(outfile, np.column_stack((depths, tilts, azimuths, eastings, northings, elevations, dogleg_severity)),
+                   fmt="%.4f", delimiter=",")
+    return output_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimum-curvature desurvey of a converted survey CSV")
+    parser.add_argument("input_file")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--collar", type=float, nargs=3, default=(0.0, 0.0, 0.0), metavar=("EASTING", "NORTHING", "ELEVATION"))
+    parser.add_argument("--collar-depth", type=float, default=0.0, help="depth the collar coordinates are at")
+    parser.add_argument("--dogleg-length", type=float, default=30.0, help="DLS is reported in degrees per this many metres")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.input_file)[0] + "_desurvey.csv"
+    desurvey_csv(args.input_file, output, *args.collar, dogleg_length=args.dogleg_length,
+                 collar_depth=args.collar_depth)
+    print(f"Desurvey complete. Output saved to: {output}")
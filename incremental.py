@@ -0,0 +1,180 @@
+import logging
+import os
+import pickle
+import time
+import numpy as np
+
+import logReader
+from sampleFilter import SampleFilter
+from TeleviewerToGyro import (CHUNK_SIZE, ConversionMetrics, Gyro, StreamingResampler, Survey, SurveyWriter,
+                              check_output_file, correct_azimuths, find_columns, output_file_name)
+
+logger = logging.getLogger("TeleviewerToGyro")
+
+STATE_VERSION = 3
+
+
+class IncrementalConversion:
+    # Conversion of an export that is still being logged. Remembers the byte offset of the
+    # last complete line read, the filter and resampler state, and the depth down to which
+    # the output CSV is final. Each update parses only the appended lines and rewrites only
+    # the tail of the survey that later samples could still change. Assumes depth keeps
+    # increasing as the file grows, as it does while logging down the hole.
+    def __init__(self, input_file, output_file, config):
+        if config.output_format != "csv":
+            raise ValueError("Incremental conversion only appends to CSV output")
+        self.version = STATE_VERSION
+        self.input_file = input_file
+        self.output_file = output_file
+        self.config = config
+        self.offset = 0
+        self.columns = None
+        self.headers = None
+        self.decimals = (None, None)
+        self.sample_filter = SampleFilter.from_config(config)
+        self.resampler = StreamingResampler(config.method, config.dedupe, config.dedupe_tolerance,
+                                            config.resample_workers)
+        self.settled_depth = None
+        self.settled_bytes = 0
+
+    def read_appended(self, metrics):
+        with metrics.stage("read") as stage:
+            with open(self.input_file, 'rb') as infile:
+                infile.seek(self.offset)
+                data = infile.read()
+            # A line still being written stays in the file for the next update
+            complete = data.rfind(b"\n") + 1
+            self.offset += complete
+            lines = [line for line in data[:complete].decode(errors="replace").splitlines() if line.strip()]
+
+            if self.columns is None and lines:
+                header = lines.pop(0).split()
+                self.columns = find_columns(header)
+                self.headers = Gyro(*(header[i] for i in self.columns))
+                self.decimals = tuple(logReader.column_decimals(lines[:logReader.DECIMALS_ROWS], self.columns[:2]))
+                binned = self.config.method in ("bin", "bin_median") and self.config.sample_intervals != 0
+                with SurveyWriter(self.output_file, self.headers, self.config, binned):
+                    pass
+                self.settled_bytes = os.path.getsize(self.output_file)
+            chunks = [logReader.parse_rows(lines[start:start + CHUNK_SIZE], self.columns)
+                      for start in range(0, len(lines), CHUNK_SIZE)]
+            stage["rows"] += len(lines)
+        return chunks
+
+    def update(self, metrics=None, final=False):
+        # Returns the number of survey rows written or rewritten. final=True flushes samples
+        # the spike filter is still holding and settles the whole survey, for when logging ends.
+        metrics = metrics or ConversionMetrics()
+        chunks = self.read_appended(metrics)
+        if self.columns is None:
+            return 0
+
+        with metrics.stage("filter") as stage:
+            accepted = [self.sample_filter.add_chunk(*chunk) for chunk in chunks]
+            if final:
+                accepted.append(self.sample_filter.flush())
+            stage["rows"] += sum(len(chunk[0]) for chunk in chunks)
+        accepted = [(depths, tilts, correct_azimuths(azimuths, self.config.declination))
+                    for depths, tilts, azimuths in accepted if len(depths)]
+
+        if self.config.sample_intervals == 0:
+            # All-data output never changes once written, so every accepted sample is final
+            with metrics.stage("write") as stage:
+                columns = [np.concatenate(column) for column in zip(*accepted)] if accepted else [[], [], []]
+                survey = Survey(*columns, decimals=self.decimals)
+                self.append_rows(survey, len(survey))
+                stage["rows"] += len(survey)
+            return len(survey)
+
+        with metrics.stage("resample") as stage:
+            for depths, tilts, azimuths in accepted:
+                self.resampler.add_chunk(depths, tilts, azimuths)
+            if self.resampler.start_depth is None:
+                return 0
+            depths, tilts, azimuths, *stats = self.resampler.resample(self.config.sample_intervals)
+            copied = self.config.method == "nearest" and self.config.dedupe != "mean"
+            survey = Survey(depths, tilts, azimuths, vars(self.headers).values(), self.config.hole_id, *stats,
+                            decimals=(None, self.decimals[1] if copied else None))
+            stage["rows"] += self.resampler.sample_count
+
+        # Stations more than an interval (plus any dedupe tolerance) above the deepest sample
+        # cannot be changed by deeper samples
+        if self.settled_depth is not None:
+            survey = survey[int(np.searchsorted(survey.depths, self.settled_depth, side="right")):]
+        margin = self.config.sample_intervals + max(self.config.dedupe_tolerance, 1.0)
+        settled = len(survey) if final else int(np.searchsorted(survey.depths, self.resampler.end_depth - margin,
+                                                                 side="right"))
+        with metrics.stage("write") as stage:
+            written = self.append_rows(survey, settled)
+            stage["rows"] += written
+        if settled:
+            self.settled_depth = survey.depths[settled - 1]
+            self.resampler.settle(self.settled_depth, self.config.sample_intervals)
+        return written
+
+    def append_rows(self, survey, settled):
+        # Cut the output back to its last final row, append the rows that just became final,
+        # remember where they end, then append the provisional tail
+        with open(self.output_file, 'r+b') as outfile:
+            outfile.truncate(self.settled_bytes)
+        with SurveyWriter(self.output_file, self.headers, self.config, survey.binned, True, survey.decimals) as writer:
+            writer.write(*(column[:settled] for column in survey.values()))
+        self.settled_bytes = os.path.getsize(self.output_file)
+        with SurveyWriter(self.output_file, self.headers, self.config, survey.binned, True, survey.decimals) as writer:
+            writer.write(*(column[settled:] for column in survey.values()))
+        return len(survey)
+
+    def save(self, state_file):
+        temp_file = f"{state_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'wb') as outfile:
+            pickle.dump(self, outfile)
+        os.replace(temp_file, state_file)
+
+
+def state_file_name(input_file):
+    return input_file + ".state"
+
+
+def load_incremental(input_file, config, state_file=None):
+    # Picks up the saved state if it belongs to this input and configuration and both files
+    # are still there; otherwise starts a new conversion with a fresh _N_ output name
+    state_file = state_file or state_file_name(input_file)
+    try:
+        with open(state_file, 'rb') as infile:
+            state = pickle.load(infile)
+        if (state.version == STATE_VERSION and state.input_file == input_file and vars(state.config) == vars(config)
+                and os.path.exists(state.output_file) and os.path.getsize(input_file) >= state.offset):
+            return state
+        logger.info(f"Saved state in {state_file} does not match, starting over")
+    except FileNotFoundError:
+        pass
+    except (OSError, pickle.UnpicklingError, AttributeError, EOFError, ImportError) as error:
+        logger.warning(f"Could not read {state_file} ({error}), starting over")
+    output_file = check_output_file(output_file_name(input_file, config), 1)
+    return IncrementalConversion(input_file, output_file, config)
+
+
+def update_conversion(input_file, config, state_file=None, metrics=None, final=False):
+    state_file = state_file or state_file_name(input_file)
+    state = load_incremental(input_file, config, state_file)
+    rows = state.update(metrics, final)
+    state.save(state_file)
+    return state.output_file, rows
+
+
+def watch_file(input_file, config, poll_seconds=10.0, state_file=None, cancel_event=None):
+    # Polls the export until cancelled or interrupted, then settles the survey and stops
+    output_file = None
+    try:
+        while cancel_event is None or not cancel_event.is_set():
+            start = time.perf_counter()
+            output_file, rows = update_conversion(input_file, config, state_file)
+            logger.info(f"{time.strftime('%H:%M:%S')} {rows} rows updated in {time.perf_counter() - start:.3f} s")
+            if cancel_event is not None:
+                cancel_event.wait(poll_seconds)
+            else:
+                time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        pass
+    output_file, _ = update_conversion(input_file, config, state_file, final=True)
+    return output_file
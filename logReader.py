@@ -0,0 +1,256 @@
+import csv
+import os
+from functools import lru_cache
+from itertools import islice
+import numpy as np
+
+# Input layouts the converter reads. Binary logs (.tvlog) have their own reader in binaryLog.
+# text: whitespace-separated columns under a one-line header, like gyro.txt
+# csv:  comma-separated with a header row, like survey_3Aces_Master.csv
+# las:  LAS 2.0 well log, curves named in ~Curve and data under ~ASCII
+FORMATS = ("text", "csv", "las")
+CHUNK_SIZE = 100000
+DETECT_BYTES = 64 * 1024
+DECIMALS_ROWS = 100
+# Sentinels the televiewer software writes for missing values
+NULL_VALUES = (-999.25, -99999.0)
+
+# Aliases per role. Long ones match anywhere in the column name, so DEPT[M] and
+# AZIMUTH_(A are found as before; short ones must be the whole name (or LAS mnemonic).
+DEPTH_ALIASES = ("DEPT", "DIST")
+DEPTH_NAMES = ("MD",)
+TILT_ALIASES = ("TILT", "INCL", "DEVI")
+DIP_NAMES = ("DIP",)
+AZIMUTH_ALIASES = ("AZIM",)
+AZIMUTH_NAMES = ("AZI", "HAZI")
+FEET_UNITS = ("F", "FT", "FEET")
+FEET_TO_METRES = 0.3048
+
+
+class ColumnMap:
+    # Where depth, tilt and azimuth sit in a header. When the file has dip (from horizontal)
+    # instead of tilt, is_dip is set and readers convert it to tilt from vertical.
+    def __init__(self, depth, tilt, azimuth, is_dip=False):
+        self.depth = depth
+        self.tilt = tilt
+        self.azimuth = azimuth
+        self.is_dip = is_dip
+
+    @property
+    def usecols(self):
+        return self.depth, self.tilt, self.azimuth
+
+
+class LogFile:
+    # One input file after format detection: its layout, column names and where data starts
+    def __init__(self, path, format, columns, column_map, data_line, delimiter=None, null_value=None,
+                 depth_scale=1.0):
+        self.path = path
+        self.format = format
+        self.columns = columns
+        self.column_map = column_map
+        self.data_line = data_line
+        self.delimiter = delimiter
+        self.null_value = null_value
+        self.depth_scale = depth_scale
+        self.decimals = self.read_decimals()
+
+    def read_decimals(self):
+        # Decimals of depth and tilt as written in the file, so values passed through unchanged
+        # can be written back the same way (38.9000 and not 38.9). None for converted columns.
+        with open(self.path, 'r', errors="replace") as infile:
+            lines = (line for line in islice(infile, self.data_line, None)
+                     if not line.isspace() and not line.startswith("#"))
+            null_values = NULL_VALUES if self.null_value is None else NULL_VALUES + (self.null_value,)
+            decimals = column_decimals(islice(lines, DECIMALS_ROWS), self.column_map.usecols[:2], self.delimiter,
+                                       null_values)
+        if self.depth_scale != 1.0:
+            decimals[0] = None
+        if self.column_map.is_dip:
+            decimals[1] = None
+        return tuple(decimals)
+
+    @property
+    def header(self):
+        # Names of the depth, tilt and azimuth columns, as written to the output header
+        names = [self.columns[i] for i in self.column_map.usecols]
+        if self.depth_scale != 1.0:
+            names[0] = f"{names[0]}[M]"
+        if self.column_map.is_dip:
+            names[1] = "TILT"
+        return names
+
+
+def role_of(name):
+    name = name.strip().upper()
+    if any(alias in name for alias in DEPTH_ALIASES) or name in DEPTH_NAMES:
+        return "depth"
+    if any(alias in name for alias in TILT_ALIASES):
+        return "tilt"
+    if name in DIP_NAMES:
+        return "dip"
+    if any(alias in name for alias in AZIMUTH_ALIASES) or name in AZIMUTH_NAMES:
+        return "azimuth"
+    return None
+
+
+@lru_cache(maxsize=256)
+def map_columns(columns):
+    # Cached per distinct header, so a batch of files from the same tool maps columns once.
+    # The first column in each role wins; tilt is preferred over dip when both are present.
+    found = {}
+    for i, name in enumerate(columns):
+        found.setdefault(role_of(name), i)
+    tilt = found.get("tilt", found.get("dip"))
+    if "depth" not in found or tilt is None or "azimuth" not in found:
+        raise ValueError(f"Could not find DEPT, TILT and AZIMUTH columns in header: {list(columns)}")
+    return ColumnMap(found["depth"], tilt, found["azimuth"], is_dip="tilt" not in found)
+
+
+def detect_format(path):
+    with open(path, 'r', errors="replace") as infile:
+        head = infile.read(DETECT_BYTES)
+    for line in head.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if stripped.upper().startswith("~V"):
+            return "las"
+        return "csv" if "," in stripped else "text"
+    raise ValueError(f"No header found in {path}")
+
+
+def open_log(path):
+    format = detect_format(path)
+    if format == "las":
+        return open_las(path)
+
+    with open(path, 'r', newline='' if format == "csv" else None) as infile:
+        for line_number, line in enumerate(infile):
+            if line.strip():
+                break
+    columns = next(csv.reader([line])) if format == "csv" else line.split()
+    columns = tuple(name.strip() for name in columns)
+    return LogFile(path, format, list(columns), map_columns(columns), line_number + 1,
+                   delimiter="," if format == "csv" else None)
+
+
+def open_las(path):
+    # Reads the LAS 2.0 header sections: WRAP from ~Version, NULL from ~Well, curve
+    # mnemonics and units from ~Curve. Data starts on the line after ~ASCII.
+    section = None
+    wrapped = False
+    null_value = None
+    mnemonics = []
+    units = []
+    with open(path, 'r', errors="replace") as infile:
+        for line_number, line in enumerate(infile):
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#"):
+                continue
+            if stripped.startswith("~"):
+                section = stripped[1:2].upper()
+                if section == "A":
+                    break
+                continue
+            name, _, rest = stripped.partition(".")
+            name = name.strip().upper()
+            unit = rest.split(None, 1)[0] if rest and not rest[0].isspace() else ""
+            value = rest[len(unit):].split(":", 1)[0].strip()
+            if section == "V" and name == "WRAP":
+                wrapped = value.upper().startswith("Y")
+            elif section == "W" and name == "NULL":
+                null_value = float(value)
+            elif section == "C":
+                mnemonics.append(name)
+                units.append(unit.upper())
+        else:
+            raise ValueError(f"No ~ASCII data section in {path}")
+
+    if wrapped:
+        raise ValueError(f"Wrapped LAS files are not supported: {path}")
+    column_map = map_columns(tuple(mnemonics))
+    depth_scale = FEET_TO_METRES if units[column_map.depth] in FEET_UNITS else 1.0
+    return LogFile(path, "las", mnemonics, column_map, line_number + 1, null_value=null_value,
+                   depth_scale=depth_scale)
+
+
+def column_decimals(lines, usecols, delimiter=None, null_values=NULL_VALUES):
+    # Most decimals seen in each column among values that format back to exactly the text
+    # read, or None if none do (exponents, leading zeros and such). Nulls are not counted.
+    found = [None] * len(usecols)
+    for line in lines:
+        row = line.split(delimiter)
+        for column, i in enumerate(usecols):
+            try:
+                text = row[i].strip()
+                value = float(text)
+                if value != value or value in null_values:
+                    continue
+                decimals = len(text) - text.index(".") - 1 if "." in text else 0
+                if f"{value:.{decimals}f}" == text:
+                    found[column] = max(decimals, found[column] or 0)
+            except (ValueError, IndexError):
+                continue
+    return found
+
+
+def parse_rows(lines, usecols, delimiter=None):
+    # Bulk parse of one chunk into one float64 array per column in usecols. Rows that are
+    # short or not numeric are dropped one by one.
+    try:
+        values = np.loadtxt(lines, dtype=np.float64, delimiter=delimiter, usecols=usecols, ndmin=2)
+    except (ValueError, IndexError):
+        parsed = []
+        for line in lines:
+            row = line.split(delimiter)
+            try:
+                parsed.append(tuple(float(row[i]) for i in usecols))
+            except (ValueError, IndexError):
+                continue
+        values = np.array(parsed, dtype=np.float64).reshape(-1, len(usecols))
+    return tuple(values.T)
+
+
+def read_chunks(log, chunk_size=CHUNK_SIZE, progress=None):
+    # Yields depth, tilt and azimuth arrays, chunk_size rows at a time, in file order.
+    # Depth is in metres and tilt from vertical whatever the source used; LAS nulls are NaN.
+    # progress(done_bytes, total_bytes) is called after each chunk is read.
+    total_bytes = os.path.getsize(log.path)
+    with open(log.path, 'r') as infile:
+        for _ in range(log.data_line):
+            infile.readline()
+        lines = []
+        for line in infile:
+            if line.isspace() or line.startswith("#"):
+                continue
+            lines.append(line)
+            if len(lines) >= chunk_size:
+                if progress is not None:
+                    progress(infile.buffer.tell(), total_bytes)
+                yield convert_rows(log, *parse_rows(lines, log.column_map.usecols, log.delimiter))
+                lines = []
+        if lines:
+            yield convert_rows(log, *parse_rows(lines, log.column_map.usecols, log.delimiter))
+    if progress is not None:
+        progress(total_bytes, total_bytes)
+
+
+def convert_rows(log, depths, tilts, azimuths):
+    if log.null_value is not None:
+        for column in (depths, tilts, azimuths):
+            column[column == log.null_value] = np.nan
+    if log.depth_scale != 1.0:
+        depths = depths * log.depth_scale
+    if log.column_map.is_dip:
+        tilts = 90.0 - np.abs(tilts)
+    return depths, tilts, azimuths
+
+
+def read_log(path):
+    # Whole file as three arrays
+    log = open_log(path)
+    chunks = list(read_chunks(log))
+    if not chunks:
+        return log, np.empty(0), np.empty(0), np.empty(0)
+    return (log, *(np.concatenate(column) for column in zip(*chunks)))
@@ -0,0 +1,125 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+import numpy as np
+
+# Long logs can be resampled in depth windows by worker processes. The output depths are cut
+# into one run per worker, each worker maps the slice of samples its run depends on straight
+# from shared memory, and the runs are joined back in depth order. Every window computes its
+# values exactly as the single pass would, so the result is the same arrays. Cutting needs
+# depths in logged (non-decreasing) order; other logs, and short ones, run in one pass.
+#
+# Costs from `benchmark.py resample` (up to 3M rows at 1 cm, interval 1): one pass per method
+# in ns per row, and the windowed overhead, which is about 20 ms of pool start-up plus a
+# per-row part for cutting the windows and copying into shared memory.
+RESAMPLE_NS_PER_ROW = {"nearest": 25, "linear": 80, "bin": 80, "bin_median": 350}
+WINDOW_NS_PER_ROW = {"nearest": 27, "linear": 5, "bin": 60, "bin_median": 40}
+WINDOW_STARTUP_SECONDS = 0.02
+# Samples per window when a long log is resampled in steps here, to report progress
+PROGRESS_ROWS = 100000
+
+
+def parallel_min_rows(method, workers):
+    # Log length from which this many windows on as many idle cores beat one pass, None if
+    # never: the time saved per row has to pay for the start-up. With the costs above that is
+    # about 150k rows for bin_median and 570k for linear on 2 cores; nearest never gains.
+    saved = RESAMPLE_NS_PER_ROW[method] * (1 - 1 / workers) - WINDOW_NS_PER_ROW[method]
+    return int(WINDOW_STARTUP_SECONDS * 1e9 / saved) if saved > 0 else None
+
+
+def window_count(depths, target_depths, workers, method):
+    # Windows to cut this log into, 1 meaning a single pass here. workers=0 uses every core.
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(target_depths))
+    if workers < 2:
+        return 1
+    min_rows = parallel_min_rows(method, min(workers, os.cpu_count() or 1))
+    if min_rows is None or len(depths) < min_rows or np.any(depths[1:] < depths[:-1]):
+        return 1
+    return workers
+
+
+def window_bounds(method, keys, target_depths, sample_intervals, first, last):
+    # Slice of the sorted keys that output depths target_depths[first:last] can depend on
+    top, bottom = target_depths[first], target_depths[last - 1]
+    if method in ("bin", "bin_median"):
+        # A bin never reaches more than half an interval past its depth
+        return (int(np.searchsorted(keys, top - sample_intervals, "left")),
+                int(np.searchsorted(keys, bottom + sample_intervals, "right")))
+    if method == "linear":
+        # The samples either side of each output depth, however far apart they are
+        return (max(int(np.searchsorted(keys, top, "right")) - 1, 0),
+                min(int(np.searchsorted(keys, bottom, "right")) + 1, len(keys)))
+    # nearest: from the first sample of the last key above the window to the first key below it
+    above = int(np.searchsorted(keys, top, "left")) - 1
+    return (int(np.searchsorted(keys, keys[above], "left")) if above >= 0 else 0,
+            min(int(np.searchsorted(keys, bottom, "left")) + 1, len(keys)))
+
+
+def run_windows(compute, method, columns, target_range, windows, workers, progress=None):
+    # compute(method, columns, target_range, first, last, start) resamples one window and must
+    # be a module-level function, so workers can import it. columns[0] holds the sorted keys
+    # the windows are cut on. Returns one result per window, in depth order. With one worker
+    # the windows run here, one after another.
+    columns = [np.asarray(column, dtype=np.float64) for column in columns]
+    target_depths = np.arange(*target_range)
+    progress = progress or (lambda done, total: None)
+    edges = np.linspace(0, len(target_depths), windows + 1).astype(np.int64)
+    windows = [(int(first), int(last), *window_bounds(method, columns[0], target_depths, target_range[2], first, last))
+               for first, last in zip(edges[:-1], edges[1:])]
+    progress(0, len(target_depths))
+    if workers < 2:
+        results = []
+        for first, last, start, stop in windows:
+            results.append(compute(method, [column[start:stop] for column in columns], target_range, first, last,
+                                   start))
+            progress(last, len(target_depths))
+        return results
+
+    with shared_arrays(columns) as blocks, ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(resample_window, compute, method, blocks, target_range, *window):
+                   window[1] - window[0] for window in windows}
+        try:
+            done = 0
+            for future in as_completed(futures):
+                future.result()
+                done += futures[future]
+                progress(done, len(target_depths))
+        except BaseException:
+            # Cancelled or failed: windows not yet started are dropped rather than waited for
+            for future in futures:
+                future.cancel()
+            raise
+        return [future.result() for future in futures]
+
+
+@contextmanager
+def shared_arrays(columns):
+    # Copies float64 columns into shared memory, removed again on exit. Workers get
+    # (name, length) pairs and map the blocks, so the samples are never pickled.
+    blocks = []
+    try:
+        for column in columns:
+            block = shared_memory.SharedMemory(create=True, size=max(column.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(len(column), dtype=np.float64, buffer=block.buf)[:] = column
+        yield [(block.name, len(column)) for block, column in zip(blocks, columns)]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def resample_window(compute, method, blocks, target_range, first, last, start, stop):
+    # Runs in a worker process. The views into shared memory only live inside compute, so
+    # the blocks can be closed once it returns.
+    opened = [shared_memory.SharedMemory(name=name) for name, _ in blocks]
+    try:
+        return compute(method, [np.ndarray(length, dtype=np.float64, buffer=block.buf)[start:stop]
+                                for block, (_, length) in zip(opened, blocks)],
+                       target_range, first, last, start)
+    finally:
+        for block in opened:
+            block.close()
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import numpy as np
+
+from TeleviewerToGyro import Survey
+
+CACHE_VERSION = 3
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".televiewer_to_gyro_cache")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class ResultCache:
+    # Resampled surveys stored as .npz files keyed by a hash of the input file contents and
+    # the numeric parameters. File mtimes double as the LRU clock; hits touch the entry.
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, input_file, config, progress=None):
+        # progress is called with (bytes hashed, file size) between blocks
+        digest = hashlib.blake2b(digest_size=20)
+        total_bytes = os.path.getsize(input_file)
+        with open(input_file, 'rb') as infile:
+            for block in iter(lambda: infile.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+                if progress is not None:
+                    progress(infile.tell(), total_bytes)
+        digest.update(repr((CACHE_VERSION, float(config.declination), float(config.casing_height),
+                            config.sample_intervals, config.method, config.dedupe,
+                            float(config.dedupe_tolerance), [float(value) for value in config.null_values],
+                            [float(limit) for limit in config.tilt_range + config.azimuth_range],
+                            config.spike_window, float(config.spike_threshold),
+                            float(config.spike_floor))).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                stats = [data[name] for name in ("tilt_stds", "azimuth_stds", "counts") if name in data]
+                decimals = [None if value < 0 else int(value) for value in data["decimals"]]
+                survey = Survey(data["depths"], data["tilts"], data["azimuths"], data["headers"].tolist(), None,
+                                *stats, decimals=decimals)
+        except (OSError, KeyError, ValueError):
+            return None
+        os.utime(path)
+        return survey
+
+    def put(self, key, survey):
+        # Source decimals are kept (-1 for none) so a cached run writes the same CSV
+        path = self.path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        columns = {}
+        if survey.binned:
+            columns = dict(tilt_stds=survey.tilt_stds, azimuth_stds=survey.azimuth_stds, counts=survey.counts)
+        with open(temp_path, 'wb') as outfile:
+            np.savez_compressed(outfile, headers=np.array(survey.columns), depths=survey.depths, tilts=survey.tilts,
+                                azimuths=survey.azimuths,
+                                decimals=np.array([-1 if value is None else value for value in survey.decimals]),
+                                **columns)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz"):
+                os.remove(os.path.join(self.cache_dir, name))
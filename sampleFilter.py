@@ -0,0 +1,200 @@
+import csv
+import logging
+import os
+import numpy as np
+
+from logReader import NULL_VALUES
+
+logger = logging.getLogger("TeleviewerToGyro")
+
+REJECT_REASONS = ("casing", "null", "tilt_range", "azimuth_range", "tilt_spike", "azimuth_spike")
+ROLLING_BLOCK_ROWS = 262144
+MAD_SCALE = 1.4826
+
+
+def rolling_median(values, window):
+    # Centred running median over an odd window, edges reflected. O(rows * window), run in
+    # blocks so the window views never need more than a block's worth of memory.
+    half = window // 2
+    if len(values) == 0 or half == 0:
+        return values.copy()
+    padded = np.pad(values, half, mode="reflect" if len(values) > 1 else "edge")
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1)
+    medians = np.empty(len(values))
+    for start in range(0, len(values), ROLLING_BLOCK_ROWS):
+        block = windows[start:start + ROLLING_BLOCK_ROWS]
+        medians[start:start + len(block)] = np.partition(block, half, axis=1)[:, half]
+    return medians
+
+
+def spike_flags(values, window, threshold, floor, circular=False):
+    # Samples further from the running median than threshold robust standard deviations
+    # (MAD * 1.4826), and never less than floor degrees. Azimuths are unwrapped first and
+    # their residuals wrapped back, so 359 next to 1 is not a spike.
+    if circular:
+        values = np.unwrap(values, period=360.0)
+    residuals = values - rolling_median(values, window)
+    if circular:
+        residuals = (residuals + 180.0) % 360.0 - 180.0
+    deviations = np.abs(residuals)
+    return deviations > np.maximum(threshold * MAD_SCALE * rolling_median(deviations, window), floor)
+
+
+class SampleFilter:
+    # Decides which samples go on to dedupe and resampling, over whole arrays: casing depth,
+    # sentinel nulls and NaN, per-column range limits, then optionally a rolling median/MAD
+    # spike test on tilt and azimuth. Each rejected row is recorded with its reason.
+    # Spike windows run over the samples that passed the other tests. When chunks are fed in
+    # one at a time the last 2 * (window // 2) of them are held back until the next chunk
+    # arrives, so chunked and whole-file runs make the same decisions.
+    def __init__(self, casing_height=15.0, null_values=NULL_VALUES, tilt_range=(-1000.0, 1000.0),
+                 azimuth_range=(-1000.0, 1000.0), spike_window=0, spike_threshold=3.5, spike_floor=0.5):
+        self.casing_height = casing_height
+        self.null_values = np.asarray(null_values, dtype=np.float64)
+        self.tilt_range = tilt_range
+        self.azimuth_range = azimuth_range
+        self.half_window = spike_window // 2
+        self.spike_threshold = spike_threshold
+        self.spike_floor = spike_floor
+        self.rows = 0
+        self.counts = dict.fromkeys(REJECT_REASONS, 0)
+        self.rejected = []
+        self.context = None
+        self.pending = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.casing_height, config.null_values, config.tilt_range, config.azimuth_range,
+                   config.spike_window, config.spike_threshold, config.spike_floor)
+
+    def is_null(self, values):
+        return np.isnan(values) | np.isin(values, self.null_values)
+
+    def basic_reasons(self, depths, tilts, azimuths):
+        # 0 keeps the row, otherwise 1 + index into REJECT_REASONS. Later tests only
+        # overwrite rows still at 0, so the first failing test names the reason.
+        reasons = np.zeros(len(depths), dtype=np.int8)
+        tests = (np.trunc(depths) < self.casing_height,
+                 self.is_null(depths) | self.is_null(tilts) | self.is_null(azimuths),
+                 (tilts < self.tilt_range[0]) | (tilts > self.tilt_range[1]),
+                 (azimuths < self.azimuth_range[0]) | (azimuths > self.azimuth_range[1]))
+        for code, failed in enumerate(tests, start=1):
+            reasons[failed & (reasons == 0)] = code
+        return reasons
+
+    def record(self, rows, reasons, depths, tilts, azimuths):
+        counts = np.bincount(reasons, minlength=len(REJECT_REASONS) + 1)
+        for code, reason in enumerate(REJECT_REASONS, start=1):
+            self.counts[reason] += int(counts[code])
+        # Casing rows are counted but not listed; every hole has a few metres of them
+        listed = reasons > 1
+        if listed.any():
+            self.rejected.append((rows[listed], reasons[listed], depths[listed], tilts[listed], azimuths[listed]))
+
+    def mask(self, depths, tilts, azimuths):
+        # Whole file at once; returns the keep mask in input order
+        depths, tilts, azimuths = (np.asarray(column, dtype=np.float64) for column in (depths, tilts, azimuths))
+        rows = self.rows + np.arange(len(depths))
+        self.rows += len(depths)
+        reasons = self.basic_reasons(depths, tilts, azimuths)
+        if self.half_window:
+            valid = np.flatnonzero(reasons == 0)
+            reasons[valid] = self.spike_reasons(tilts[valid], azimuths[valid])
+        self.record(rows, reasons, depths, tilts, azimuths)
+        return reasons == 0
+
+    def spike_reasons(self, tilts, azimuths):
+        window = 2 * self.half_window + 1
+        reasons = np.zeros(len(tilts), dtype=np.int8)
+        reasons[spike_flags(azimuths, window, self.spike_threshold, self.spike_floor, circular=True)] = 6
+        reasons[spike_flags(tilts, window, self.spike_threshold, self.spike_floor)] = 5
+        return reasons
+
+    def filter_chunks(self, chunks, metrics):
+        # Yields the accepted depth, tilt and azimuth arrays in input order. Without a spike
+        # window that is one group per chunk; with one, groups lag by up to a window.
+        for depths, tilts, azimuths in chunks:
+            with metrics.stage("filter") as stage:
+                accepted = self.add_chunk(depths, tilts, azimuths)
+                stage["rows"] += len(depths)
+            if len(accepted[0]):
+                yield accepted
+        with metrics.stage("filter"):
+            accepted = self.flush()
+        if len(accepted[0]):
+            yield accepted
+
+    def add_chunk(self, depths, tilts, azimuths):
+        depths, tilts, azimuths = (np.asarray(column, dtype=np.float64) for column in (depths, tilts, azimuths))
+        rows = self.rows + np.arange(len(depths))
+        self.rows += len(depths)
+        reasons = self.basic_reasons(depths, tilts, azimuths)
+        if not self.half_window:
+            self.record(rows, reasons, depths, tilts, azimuths)
+            keep = reasons == 0
+            return depths[keep], tilts[keep], azimuths[keep]
+
+        # Basic rejects are final now; valid samples join the pending spike queue
+        rejected = reasons != 0
+        self.record(rows[rejected], reasons[rejected], depths[rejected], tilts[rejected], azimuths[rejected])
+        valid = ~rejected
+        new = (rows[valid], depths[valid], tilts[valid], azimuths[valid])
+        self.pending = new if self.pending is None else tuple(np.concatenate(pair) for pair in zip(self.pending, new))
+        return self.decide(final=False)
+
+    def flush(self):
+        if not self.half_window or self.pending is None:
+            return np.empty(0), np.empty(0), np.empty(0)
+        return self.decide(final=True)
+
+    def decide(self, final):
+        # Spike decisions for pending samples that have a full two half-windows of samples
+        # on both sides (or are at the true start or end of the log)
+        reach = 2 * self.half_window
+        context = self.context if self.context is not None else (np.empty(0), np.empty(0))
+        rows, depths, tilts, azimuths = self.pending
+        decided = len(rows) if final else max(len(rows) - reach, 0)
+        if decided == 0:
+            return np.empty(0), np.empty(0), np.empty(0)
+
+        all_tilts = np.concatenate((context[0], tilts))
+        all_azimuths = np.concatenate((context[1], azimuths))
+        reasons = self.spike_reasons(all_tilts, all_azimuths)[len(context[0]):][:decided]
+        self.record(rows[:decided], reasons, depths[:decided], tilts[:decided], azimuths[:decided])
+
+        end = len(context[0]) + decided
+        self.context = (all_tilts[max(end - reach, 0):end], all_azimuths[max(end - reach, 0):end])
+        self.pending = tuple(column[decided:] for column in self.pending)
+        keep = reasons == 0
+        return depths[:decided][keep], tilts[:decided][keep], azimuths[:decided][keep]
+
+    def log_summary(self):
+        rejected = {reason: count for reason, count in self.counts.items() if count}
+        if rejected:
+            logger.info("Rejected samples: " + ", ".join(f"{count} {reason}" for reason, count in rejected.items()))
+
+    def write_rejected(self, output_file):
+        # One line per rejected row outside the casing: data row number (1-based, blank lines
+        # not counted), the values as read and the first test it failed
+        if self.rejected:
+            rows, reasons, depths, tilts, azimuths = (np.concatenate(column) for column in zip(*self.rejected))
+            order = np.argsort(rows, kind="stable")
+        else:
+            rows = reasons = depths = tilts = azimuths = order = np.empty(0, dtype=np.intp)
+        with open(output_file, 'w', newline='') as outfile:
+            csv_writer = csv.writer(outfile)
+            csv_writer.writerow(["ROW", "DEPTH", "TILT", "AZIMUTH", "REASON"])
+            csv_writer.writerows(zip((rows[order] + 1).tolist(), depths[order].tolist(), tilts[order].tolist(),
+                                     azimuths[order].tolist(),
+                                     (REJECT_REASONS[code - 1] for code in reasons[order].tolist())))
+        return output_file
+
+
+def rejected_file_name(output_file):
+    return os.path.splitext(output_file)[0] + "_rejected.csv"
+
+
+def finish_filter(sample_filter, output_file, config):
+    sample_filter.log_summary()
+    if config.report_rejected:
+        sample_filter.write_rejected(rejected_file_name(output_file))
@@ -0,0 +1,170 @@
+import argparse
+import os
+import numpy as np
+
+import binaryLog
+import logReader
+from sampleFilter import SampleFilter
+from TeleviewerToGyro import ConversionConfig, Survey, correct_azimuths, find_columns
+
+MAX_PLOT_POINTS = 2000
+
+
+class Comparison:
+    def __init__(self, survey, reference, depths, tilt_differences, azimuth_differences, depth_gaps):
+        self.survey = survey
+        self.reference = reference
+        self.depths = depths
+        self.tilt_differences = tilt_differences
+        self.azimuth_differences = azimuth_differences
+        self.depth_gaps = depth_gaps
+
+    def summary(self):
+        return {"matched": len(self.depths), "reference": len(self.reference),
+                "tilt": difference_stats(self.tilt_differences),
+                "azimuth": difference_stats(self.azimuth_differences)}
+
+
+def load_survey(input_file, config=None):
+    # Converted or reference CSV, raw televiewer export, LAS file or binary log. Returns a
+    # depth-sorted Survey named after the file, with tilt from vertical like the televiewer's.
+    # Raw logs go through the same filters and declination correction as a conversion with
+    # config; CSV surveys have had that done already and are used as they are.
+    config = config or ConversionConfig()
+    if input_file.endswith(binaryLog.EXTENSION):
+        log = binaryLog.open_binary_log(input_file)
+        usecols = find_columns(log.columns)
+        depths, tilts, azimuths = (np.asarray(log.column(i), dtype=np.float64) for i in usecols)
+        header = [log.columns[i] for i in usecols]
+        raw = True
+    else:
+        log, depths, tilts, azimuths = logReader.read_log(input_file)
+        header = log.header
+        raw = log.format != "csv"
+
+    if raw:
+        keep = SampleFilter.from_config(config).mask(depths, tilts, azimuths)
+        depths, tilts = depths[keep], tilts[keep]
+        azimuths = correct_azimuths(azimuths[keep], config.declination)
+
+    order = np.argsort(depths, kind="stable")
+    return Survey(depths[order], tilts[order], azimuths[order], header, os.path.basename(input_file))
+
+
+def azimuth_differences(azimuths, reference_azimuths):
+    # Signed difference on the circle in -180..180, so 359 against 1 is -2 and not 358
+    return (np.asarray(azimuths) - np.asarray(reference_azimuths) + 180.0) % 360.0 - 180.0
+
+
+def difference_stats(differences):
+    if len(differences) == 0:
+        return {"mean": None, "std": None, "rms": None, "max_abs": None}
+    return {"mean": float(np.mean(differences)), "std": float(np.std(differences)),
+            "rms": float(np.sqrt(np.mean(differences ** 2))), "max_abs": float(np.max(np.abs(differences)))}
+
+
+def align_surveys(survey, reference, max_gap=1.0):
+    # Sorted merge: for every reference station take the nearest survey sample, and drop
+    # stations where that sample is more than max_gap metres away
+    if len(survey) == 0 or len(reference) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    upper = np.clip(np.searchsorted(survey.depths, reference.depths), 0, len(survey) - 1)
+    lower = np.clip(upper - 1, 0, len(survey) - 1)
+    take_lower = np.abs(survey.depths[lower] - reference.depths) <= np.abs(survey.depths[upper] - reference.depths)
+    nearest = np.where(take_lower, lower, upper)
+
+    matched = np.abs(survey.depths[nearest] - reference.depths) <= max_gap
+    return nearest[matched], np.flatnonzero(matched)
+
+
+def compare_surveys(survey, reference, max_gap=1.0):
+    survey_indices, reference_indices = align_surveys(survey, reference, max_gap)
+    depths = reference.depths[reference_indices]
+    return Comparison(survey, reference, depths,
+                      survey.tilts[survey_indices] - reference.tilts[reference_indices],
+                      azimuth_differences(survey.azimuths[survey_indices], reference.azimuths[reference_indices]),
+                      survey.depths[survey_indices] - depths)
+
+
+def decimate(count, max_points=MAX_PLOT_POINTS):
+    # Evenly spaced indices, always keeping the first and last sample
+    if count <= max_points:
+        return np.arange(count)
+    return np.unique(np.linspace(0, count - 1, max_points).round().astype(np.intp))
+
+
+def write_differences(comparison, output_file):
+    with open(output_file, 'w', newline='') as outfile:
+        outfile.write("DEPTH,DEPTH_GAP,TILT_DIFF,AZIMUTH_DIFF\n")
+        np.savetxt(outfile, np.column_stack((comparison.depths, comparison.depth_gaps,
+                                             comparison.tilt_differences, comparison.azimuth_differences)),
+                   fmt="%.4f", delimiter=",")
+    return output_file
+
+
+def plot_comparison(comparison, output_file=None, max_points=MAX_PLOT_POINTS):
+    # Polar depth-vs-azimuth chart of both surveys plus the differences against depth.
+    # With an output file the Agg backend is used, so this runs without a display.
+    import matplotlib
+    if output_file:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    survey, reference = comparison.survey, comparison.reference
+    fig = plt.figure(figsize=(12, 6))
+    polar = fig.add_subplot(1, 2, 1, projection='polar')
+    for data, style, color in ((survey, '.', 'purple'), (reference, 'o', 'green')):
+        shown = decimate(len(data), max_points)
+        polar.plot(np.radians(data.azimuths[shown]), data.depths[shown], style, color=color, markersize=3,
+                   label=data.hole_id)
+    polar.set_theta_direction(-1)
+    polar.set_theta_offset(np.pi / 2.0)
+    polar.set_rlabel_position(0)
+    polar.set_xticks(np.radians(np.arange(0, 360, 10)))
+    polar.legend(loc='upper left', bbox_to_anchor=(1.1, 1.05))
+
+    differences = fig.add_subplot(1, 2, 2)
+    shown = decimate(len(comparison.depths), max_points)
+    differences.plot(comparison.tilt_differences[shown], comparison.depths[shown], label="Tilt")
+    differences.plot(comparison.azimuth_differences[shown], comparison.depths[shown], label="Azimuth")
+    differences.axvline(0.0, color='grey', linewidth=0.5)
+    differences.invert_yaxis()
+    differences.set_xlabel("Survey - reference (degrees)")
+    differences.set_ylabel("Depth")
+    differences.legend()
+
+    fig.suptitle(f"{survey.hole_id} vs {reference.hole_id}")
+    fig.tight_layout()
+    if output_file:
+        fig.savefig(output_file, dpi=100)
+        plt.close(fig)
+    else:
+        plt.show()
+    return fig
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare a televiewer survey against a reference gyro survey")
+    parser.add_argument("survey", help="converted CSV, televiewer text export or binary log")
+    parser.add_argument("reference", help="reference survey CSV, e.g. HoleID,Dist,Dip,Azim")
+    parser.add_argument("--declination", type=float, default=19.1, help="added to raw log azimuths")
+    parser.add_argument("--casing-height", type=float, default=15.0, help="raw log samples above this are dropped")
+    parser.add_argument("--max-gap", type=float, default=1.0, help="largest depth mismatch to pair, in metres")
+    parser.add_argument("--differences", default=None, help="write per-depth differences to this CSV")
+    parser.add_argument("--plot", default=None, help="save the comparison chart to this image file")
+    parser.add_argument("--max-points", type=int, default=MAX_PLOT_POINTS, help="points plotted per series")
+    args = parser.parse_args()
+
+    config = ConversionConfig(declination=args.declination, casing_height=args.casing_height)
+    comparison = compare_surveys(load_survey(args.survey, config), load_survey(args.reference, config), args.max_gap)
+    summary = comparison.summary()
+    print(f"Matched {summary['matched']} of {summary['reference']} reference stations")
+    for name in ("tilt", "azimuth"):
+        stats = summary[name]
+        if stats["mean"] is not None:
+            print(f"{name:>8}: mean {stats['mean']:+.3f}  std {stats['std']:.3f}  "
+                  f"rms {stats['rms']:.3f}  max {stats['max_abs']:.3f}")
+    if args.differences:
+        write_differences(comparison, args.differences)
+    if args.plot:
+        plot_comparison(comparison, args.plot, args.max_points)
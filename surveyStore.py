@@ -0,0 +1,210 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+import numpy as np
+
+from TeleviewerToGyro import BIN_STAT_HEADERS, Survey
+
+DEFAULT_CACHE_HOLES = 64
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS surveys (
+    project_code TEXT NOT NULL,
+    hole_id TEXT NOT NULL,
+    tool_name TEXT,
+    columns TEXT NOT NULL,
+    stations INTEGER NOT NULL,
+    top REAL,
+    bottom REAL,
+    source TEXT,
+    ingested REAL NOT NULL,
+    depths BLOB NOT NULL,
+    tilts BLOB NOT NULL,
+    azimuths BLOB NOT NULL,
+    tilt_stds BLOB,
+    azimuth_stds BLOB,
+    counts BLOB,
+    PRIMARY KEY (project_code, hole_id)
+);
+CREATE INDEX IF NOT EXISTS surveys_by_hole ON surveys (hole_id);
+"""
+
+
+class SurveyStore:
+    # Converted surveys for many holes in one SQLite file, one row per hole, keyed by project
+    # code and hole ID. Each column is stored as a float64 blob already sorted by depth, so
+    # loading a hole is a single read and range and nearest queries are binary searches.
+    # Recently used holes stay in memory, least recently used dropped first.
+    def __init__(self, path, cache_holes=DEFAULT_CACHE_HOLES):
+        self.path = path
+        self.cache_holes = cache_holes
+        self.cache = OrderedDict()
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+        self.cache.clear()
+
+    def add_survey(self, survey, hole_id, project_code=None, tool_name=None, source=None):
+        # Replaces any survey already stored for this hole
+        order = np.argsort(survey.depths, kind="stable")
+        columns = [np.ascontiguousarray(column[order], dtype=np.float64) for column in survey.values()]
+        blobs = [column.tobytes() for column in columns] + [None] * (6 - len(columns))
+        top, bottom = (float(columns[0][0]), float(columns[0][-1])) if len(order) else (None, None)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO surveys VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (project_code or "", hole_id, tool_name, json.dumps(survey.columns), len(order), top, bottom,
+                 source, time.time(), *blobs))
+        self.cache.pop((project_code or "", hole_id), None)
+
+    def remove(self, hole_id, project_code=None):
+        with self.connection:
+            self.connection.execute("DELETE FROM surveys WHERE project_code = ? AND hole_id = ?",
+                                    (project_code or "", hole_id))
+        self.cache.pop((project_code or "", hole_id), None)
+
+    def holes(self, project_code=None):
+        query = "SELECT project_code, hole_id, tool_name, stations, top, bottom, source, ingested FROM surveys"
+        parameters = ()
+        if project_code is not None:
+            query += " WHERE project_code = ?"
+            parameters = (project_code,)
+        names = ("project_code", "hole_id", "tool_name", "stations", "top", "bottom", "source", "ingested")
+        return [dict(zip(names, row)) for row in self.connection.execute(query + " ORDER BY project_code, hole_id",
+                                                                         parameters)]
+
+    def survey(self, hole_id, project_code=None):
+        key = (project_code or "", hole_id)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        row = self.connection.execute(
+            "SELECT columns, depths, tilts, azimuths, tilt_stds, azimuth_stds, counts FROM surveys "
+            "WHERE project_code = ? AND hole_id = ?", key).fetchone()
+        if row is None:
+            raise KeyError(f"No survey stored for hole {hole_id}" + (f" in project {project_code}" if project_code else ""))
+        columns, *blobs = row
+        arrays = [np.frombuffer(blob, dtype=np.float64) for blob in blobs if blob is not None]
+        if len(arrays) == 6:
+            arrays[5] = arrays[5].astype(np.int64)
+        survey = Survey(*arrays[:3], json.loads(columns), hole_id, *arrays[3:])
+
+        self.cache[key] = survey
+        if len(self.cache) > self.cache_holes:
+            self.cache.popitem(last=False)
+        return survey
+
+    def depth_range(self, hole_id, top, bottom, project_code=None):
+        return self.survey(hole_id, project_code).depth_range(top, bottom)
+
+    def nearest(self, hole_id, depth, project_code=None):
+        # Station closest to depth, the shallower one on a tie; None for an empty survey
+        survey = self.survey(hole_id, project_code)
+        if len(survey) == 0:
+            return None
+        upper = min(int(np.searchsorted(survey.depths, depth)), len(survey) - 1)
+        lower = max(upper - 1, 0)
+        return survey[lower if abs(survey.depths[lower] - depth) <= abs(survey.depths[upper] - depth) else upper]
+
+    def nearest_all(self, depth, project_code=None):
+        # Nearest station to one depth in every stored hole (of one project, if given)
+        return {(hole["project_code"], hole["hole_id"]): self.nearest(hole["hole_id"], depth, hole["project_code"])
+                for hole in self.holes(project_code)}
+
+    def ingest_file(self, input_file, hole_id=None, project_code=None):
+        # A survey written by create_csv_file (CSV or npz output). The hole ID and project code
+        # default to the ones in the file. npz output stores them apart; CSV only has the label,
+        # which includes the project code if there was one, so it becomes the hole ID.
+        file_hole_id, file_project_code, tool_name, survey = read_converted_survey(input_file)
+        hole_id = hole_id or file_hole_id
+        project_code = project_code if project_code is not None else file_project_code
+        self.add_survey(survey, hole_id, project_code, tool_name, os.path.abspath(input_file))
+        return hole_id
+
+
+def read_converted_survey(input_file):
+    # Returns hole ID, project code (None if not known), tool name and Survey from a converted
+    # CSV or npz file
+    if input_file.endswith(".npz"):
+        with np.load(input_file) as data:
+            names = data["columns"].tolist()
+            stats = [data[name] for name in ("tilt_std", "azimuth_std", "count") if name in data]
+            survey = Survey(data["depth"], data["tilt"], data["azimuth"], names[:3], None, *stats)
+            if "hole_id" in data:
+                return str(data["hole_id"]), str(data["project_code"]) or None, str(data["tool"]), survey
+            return str(data["label"]), None, str(data["tool"]), survey
+
+    if not input_file.endswith(".csv"):
+        raise ValueError(f"Only CSV and npz surveys can be ingested: {input_file}")
+    with open(input_file, 'r', newline='') as infile:
+        reader = csv.reader(infile)
+        header = next(reader)
+        first_row = next(reader, None)
+    binned = header[-len(BIN_STAT_HEADERS):] == BIN_STAT_HEADERS
+    usecols = (1, 2, 3, 5, 6, 7) if binned else (1, 2, 3)
+    values = np.loadtxt(input_file, dtype=np.float64, delimiter=",", skiprows=1, usecols=usecols, ndmin=2)
+    columns = [values[:, i] for i in range(len(usecols))]
+    if binned:
+        columns[5] = columns[5].astype(np.int64)
+    survey = Survey(*columns[:3], header[1:4], None, *columns[3:])
+    label, tool_name = (first_row[0], first_row[4]) if first_row else (os.path.splitext(os.path.basename(input_file))[0], None)
+    return label, None, tool_name, survey
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store converted surveys and query them by depth")
+    parser.add_argument("store", help="SQLite file, created if missing")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="add converted survey files")
+    ingest_parser.add_argument("files", nargs="+")
+    ingest_parser.add_argument("--hole-id", default=None, help="only with a single file; defaults to the file's")
+    ingest_parser.add_argument("--project-code", default=None, help="defaults to the one in npz files")
+
+    commands.add_parser("list", help="list stored holes")
+
+    range_parser = commands.add_parser("range", help="stations between two depths")
+    range_parser.add_argument("hole_id")
+    range_parser.add_argument("top", type=float)
+    range_parser.add_argument("bottom", type=float)
+    range_parser.add_argument("--project-code", default=None)
+
+    nearest_parser = commands.add_parser("nearest", help="station nearest a depth, in one hole or all of them")
+    nearest_parser.add_argument("depth", type=float)
+    nearest_parser.add_argument("--hole-id", default=None)
+    nearest_parser.add_argument("--project-code", default=None)
+    args = parser.parse_args()
+
+    with SurveyStore(args.store) as store:
+        if args.command == "ingest":
+            if args.hole_id and len(args.files) > 1:
+                parser.error("--hole-id needs a single file")
+            for input_file in args.files:
+                print(f"{input_file} -> {store.ingest_file(input_file, args.hole_id, args.project_code)}")
+        elif args.command == "list":
+            for hole in store.holes():
+                print(f"{hole['project_code'] or '-':>10} {hole['hole_id']:>20} {hole['stations']:>8} stations  "
+                      f"{hole['top']} - {hole['bottom']} m")
+        elif args.command == "range":
+            store.depth_range(args.hole_id, args.top, args.bottom, args.project_code).print_gyro()
+        elif args.hole_id:
+            station = store.nearest(args.hole_id, args.depth, args.project_code)
+            if station is not None:
+                station.print_gyro()
+        else:
+            for (project_code, hole_id), station in store.nearest_all(args.depth, args.project_code).items():
+                if station is not None:
+                    print(f"{project_code or '-'} {hole_id}: ", end="")
+                    station.print_gyro()